@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from recipes.models import Tag
+
+TAG_SLUG_MAP_KEY = 'tag-slug-map'
+
+
+def recipe_cache_key(recipe, request):
+    return (f'recipe:{recipe.pk}:v{recipe.version}:'
+            f'{request.scheme}://{request.get_host()}')
+
+
+def get_public_representations(recipes, request, render):
+    """Возвращает общую для всех зрителей часть представления рецептов.
+
+    Отсутствующие в кэше представления строятся функцией render и
+    сохраняются под ключом с текущей версией рецепта.
+    """
+    keys = [recipe_cache_key(recipe, request) for recipe in recipes]
+    cached = cache.get_many(keys)
+    missing = {}
+    for recipe, key in zip(recipes, keys):
+        if key not in cached:
+            cached[key] = missing[key] = render(recipe)
+    if missing:
+        cache.set_many(missing, settings.RECIPE_CACHE_TIMEOUT)
+    return [cached[key] for key in keys]
+
+
+def get_tag_slug_map():
+    slug_map = cache.get(TAG_SLUG_MAP_KEY)
+    if slug_map is None:
+        slug_map = dict(Tag.objects.values_list('slug', 'id'))
+        cache.set(TAG_SLUG_MAP_KEY, slug_map, None)
+    return slug_map
+
+
+def reset_tag_slug_map():
+    cache.delete(TAG_SLUG_MAP_KEY)
@@ -0,0 +1,97 @@
+"""Потоковая выгрузка списка покупок в форматах txt, csv и pdf.
+
+Генераторы принимают итератор строк (название, единица измерения,
+количество) и отдают файл частями, не собирая его целиком в памяти.
+"""
+import csv
+import os
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from rest_framework.negotiation import BaseContentNegotiation
+
+TITLE = 'Список покупок'
+PDF_FONT_NAME = 'ShoppingListFont'
+PDF_FALLBACK_FONT = 'Helvetica'
+PDF_MARGIN = 20 * mm
+PDF_LINE_HEIGHT = 7 * mm
+PDF_FONT_SIZE = 12
+CHUNK_SIZE = 64 * 1024
+
+
+class IgnoreClientContentNegotiation(BaseContentNegotiation):
+    """Не выбирает рендерер по ?format=, который занят форматом файла."""
+
+    def select_parser(self, request, parsers):
+        return parsers[0]
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def shopping_list_txt(rows):
+    yield f'{TITLE}\n\n'
+    for name, measurement_unit, total_amount in rows:
+        yield f' - {name}: {total_amount} {measurement_unit}\n'
+
+
+def shopping_list_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('Ингредиент', 'Количество', 'Единица измерения'))
+    for name, measurement_unit, total_amount in rows:
+        yield writer.writerow((name, total_amount, measurement_unit))
+
+
+def get_pdf_font():
+    if PDF_FONT_NAME in pdfmetrics.getRegisteredFontNames():
+        return PDF_FONT_NAME
+    if not os.path.exists(settings.SHOPPING_LIST_PDF_FONT):
+        return PDF_FALLBACK_FONT
+    pdfmetrics.registerFont(
+        TTFont(PDF_FONT_NAME, settings.SHOPPING_LIST_PDF_FONT))
+    return PDF_FONT_NAME
+
+
+def shopping_list_pdf(rows):
+    """Строит PDF постранично во временный файл и отдает его частями.
+
+    Файл держится в памяти до CHUNK_SIZE байт, дальше - на диске.
+    """
+    font = get_pdf_font()
+    width, height = A4
+    with SpooledTemporaryFile(max_size=CHUNK_SIZE) as buffer:
+        pdf = canvas.Canvas(buffer, pagesize=A4)
+        pdf.setTitle(TITLE)
+        pdf.setFont(font, PDF_FONT_SIZE + 4)
+        pdf.drawString(PDF_MARGIN, height - PDF_MARGIN, TITLE)
+        pdf.setFont(font, PDF_FONT_SIZE)
+        y = height - PDF_MARGIN - 2 * PDF_LINE_HEIGHT
+        for name, measurement_unit, total_amount in rows:
+            if y < PDF_MARGIN:
+                pdf.showPage()
+                pdf.setFont(font, PDF_FONT_SIZE)
+                y = height - PDF_MARGIN
+            pdf.drawString(PDF_MARGIN, y,
+                           f'- {name}: {total_amount} {measurement_unit}')
+            y -= PDF_LINE_HEIGHT
+        pdf.save()
+        buffer.seek(0)
+        while chunk := buffer.read(CHUNK_SIZE):
+            yield chunk
+
+
+EXPORT_FORMATS = {
+    'txt': (shopping_list_txt, 'text/plain; charset=utf-8'),
+    'csv': (shopping_list_csv, 'text/csv; charset=utf-8'),
+    'pdf': (shopping_list_pdf, 'application/pdf'),
+}
@@ -1,10 +1,20 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db.models import (Case, Exists, IntegerField, OuterRef, Value,
+                              When)
 from django_filters.rest_framework import FilterSet, filters
+from rest_framework.exceptions import ValidationError
 
 from recipes.models import Ingredient, Recipe
+from recipes.pantry_search import pantry_index
+from recipes.search import search_recipes
+
+from .cache import get_tag_slug_map
 
 User = get_user_model()
 
+MAX_ID = 2 ** 63 - 1
+
 
 class IngredientFilter(FilterSet):
     name = filters.CharFilter(field_name='name',
@@ -17,15 +27,50 @@ class IngredientFilter(FilterSet):
 
 class RecipeFilter(FilterSet):
     author = filters.NumberFilter(field_name="author__id")
-    tags = filters.AllValuesMultipleFilter(field_name="tags__slug")
+    tags = filters.CharFilter(method='filter_tags')
+    search = filters.CharFilter(method='filter_search')
+    have = filters.CharFilter(method='filter_have')
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart')
+    ordering = filters.ChoiceFilter(choices=(('popular', 'Популярные'),),
+                                    method='filter_ordering')
 
     class Meta:
         model = Recipe
         fields = ['author', 'tags']
 
+    def filter_tags(self, queryset, name, value):
+        slug_map = get_tag_slug_map()
+        tag_ids = {slug_map[slug] for slug in self.data.getlist(name)
+                   if slug in slug_map}
+        if not tag_ids:
+            return queryset.none()
+        return queryset.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe=OuterRef('pk'), tag__in=tag_ids)))
+
+    def filter_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
+
+    def filter_have(self, queryset, name, value):
+        try:
+            ingredient_ids = {int(id) for id in value.split(',') if id}
+        except ValueError:
+            ingredient_ids = None
+        if ingredient_ids is None or any(
+                not 0 < id <= MAX_ID for id in ingredient_ids):
+            raise ValidationError(
+                {name: 'Ожидается список id ингредиентов через запятую.'})
+        recipe_ids = pantry_index.search(ingredient_ids,
+                                         settings.PANTRY_MIN_COVERAGE,
+                                         settings.PANTRY_SEARCH_LIMIT)
+        return queryset.filter(pk__in=recipe_ids).annotate(
+            pantry_rank=Case(
+                *(When(pk=recipe_id, then=Value(rank))
+                  for rank, recipe_id in enumerate(recipe_ids)),
+                output_field=IntegerField())
+        ).order_by('pantry_rank')
+
     def filter_is_favorited(self, queryset, name, value):
         if value and not self.request.user.is_anonymous:
             return queryset.filter(favorites__user=self.request.user)
@@ -35,3 +80,6 @@ class RecipeFilter(FilterSet):
         if value and not self.request.user.is_anonymous:
             return queryset.filter(cart__user=self.request.user)
         return queryset
+
+    def filter_ordering(self, queryset, name, value):
+        return queryset.order_by('-popularity', '-pub_date', '-id')
@@ -0,0 +1,167 @@
+"""Загрузка изображений и их уменьшенные копии.
+
+В запросе проверяются только размер данных и заголовок изображения, а
+уменьшение и перекодирование выполняются в пуле потоков. Имя файла
+строится заранее, поэтому ответ не ждет записи файла.
+"""
+import base64
+import binascii
+import hashlib
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+from rest_framework.exceptions import ValidationError
+
+from recipes.files import acquire
+from recipes.models import Recipe
+from recipes.storage import DIGEST_LENGTH
+
+ALLOWED_FORMATS = {'JPEG', 'PNG', 'WEBP', 'GIF'}
+FORMAT_EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp'}
+
+User = get_user_model()
+
+logger = logging.getLogger(__name__)
+
+image_executor = ThreadPoolExecutor(max_workers=settings.IMAGE_WORKERS)
+
+
+def decode_image(data, max_size):
+    """Декодирует data:image/...;base64,... не больше max_size байт."""
+    if not isinstance(data, str):
+        raise ValidationError('Ожидается изображение в base64.')
+    header, _, encoded = data.partition(';base64,')
+    if not header.startswith('data:image/') or not encoded:
+        raise ValidationError('Ожидается изображение в base64.')
+    if len(encoded) * 3 // 4 > max_size:
+        raise ValidationError(
+            f'Изображение больше {max_size // 1024} КБ.')
+    try:
+        content = base64.b64decode(encoded, validate=True)
+    except (binascii.Error, ValueError):
+        raise ValidationError('Некорректные данные base64.')
+    try:
+        with Image.open(BytesIO(content)) as image:
+            image_format, (width, height) = image.format, image.size
+    except (UnidentifiedImageError, Image.DecompressionBombError):
+        raise ValidationError('Не удалось распознать изображение.')
+    if image_format not in ALLOWED_FORMATS:
+        raise ValidationError(
+            f'Формат {image_format} не поддерживается.')
+    if width * height > settings.IMAGE_MAX_PIXELS:
+        raise ValidationError('Слишком большое разрешение изображения.')
+    return content
+
+
+def resize_image(content, size, image_format, crop=True):
+    """Уменьшает изображение до квадрата size и перекодирует его.
+
+    С crop изображение обрезается до квадрата, иначе сохраняет пропорции.
+    Маленькие изображения не увеличиваются.
+    """
+    with Image.open(BytesIO(content)) as image:
+        image = ImageOps.exif_transpose(image)
+        has_alpha = ('A' in image.getbands()
+                     or 'transparency' in image.info)
+        mode = 'RGBA' if has_alpha and image_format != 'JPEG' else 'RGB'
+        image = image.convert(mode)
+        if crop:
+            side = min(size, *image.size)
+            image = ImageOps.fit(image, (side, side), Image.LANCZOS)
+        else:
+            image.thumbnail((size, size), Image.LANCZOS)
+        buffer = BytesIO()
+        image.save(buffer, image_format, quality=settings.IMAGE_QUALITY)
+    return buffer.getvalue()
+
+
+def write_image(storage, name, content, size, image_format, crop=True):
+    if not storage.exists(name):
+        storage.save(name, ContentFile(
+            resize_image(content, size, image_format, crop)))
+
+
+def save_avatar(user, content):
+    """Назначает аватар пользователю и записывает файл в фоне.
+
+    Возвращает Future записи файла.
+    """
+    image_format = settings.AVATAR_FORMAT
+    # Имя зависит и от параметров обработки, чтобы не менять содержимое
+    # файла с тем же именем.
+    digest = hashlib.sha256(content)
+    digest.update(f'{settings.AVATAR_SIZE}:{image_format}:'
+                  f'{settings.IMAGE_QUALITY}'.encode())
+    name = user.avatar.field.generate_filename(
+        user, f'{digest.hexdigest()[:DIGEST_LENGTH]}.'
+        f'{FORMAT_EXTENSIONS[image_format]}')
+    user.avatar.name = name
+    user.save(update_fields=('avatar',))
+    return image_executor.submit(write_avatar, user.pk, name, content)
+
+
+def write_avatar(user_id, name, content):
+    """Записывает файл аватара; при ошибке убирает аватар у пользователя."""
+    try:
+        write_image(User._meta.get_field('avatar').storage, name, content,
+                    settings.AVATAR_SIZE, settings.AVATAR_FORMAT)
+    except Exception:
+        logger.exception('Не удалось записать аватар %s', name)
+        try:
+            user = User.objects.filter(pk=user_id, avatar=name).first()
+            if user is not None:
+                user.avatar = None
+                user.save(update_fields=('avatar',))
+        finally:
+            connection.close()
+        raise
+
+
+def write_thumbnails(name):
+    """Создает уменьшенные копии изображения рецепта рядом с ним.
+
+    Возвращает имена файлов по полям рецепта.
+    """
+    storage = Recipe._meta.get_field('image').storage
+    with storage.open(name) as file:
+        content = file.read()
+    image_format = settings.RECIPE_THUMBNAIL_FORMAT
+    stem = os.path.splitext(name)[0]
+    names = {}
+    for suffix, (size, crop) in settings.RECIPE_THUMBNAILS.items():
+        thumbnail = (f'{stem}_{suffix}{size}.'
+                     f'{FORMAT_EXTENSIONS[image_format]}')
+        write_image(storage, thumbnail, content, size, image_format, crop)
+        names[f'image_{suffix}'] = thumbnail
+    return names
+
+
+def apply_thumbnails(recipe_id, name, thumbnails):
+    """Записывает миниатюры рецепту, если его изображение не сменилось."""
+    if Recipe.objects.filter(pk=recipe_id, image=name).touch(**thumbnails):
+        acquire(thumbnails.values())
+
+
+def set_thumbnails(recipe_id, name):
+    apply_thumbnails(recipe_id, name, write_thumbnails(name))
+
+
+def set_thumbnails_in_thread(recipe_id, name):
+    try:
+        set_thumbnails(recipe_id, name)
+    finally:
+        connection.close()
+
+
+def schedule_thumbnails(recipe):
+    """Создает миниатюры в фоне после фиксации транзакции."""
+    recipe_id, name = recipe.pk, recipe.image.name
+    transaction.on_commit(lambda: image_executor.submit(
+        set_thumbnails_in_thread, recipe_id, name))
@@ -0,0 +1,48 @@
+"""Пакетная загрузка данных для сериализаторов в пределах запроса."""
+from users.models import Subscribe
+
+SUBSCRIPTION_LOADER = 'subscription_loader'
+
+
+class SubscriptionLoader:
+    """Подписки текущего пользователя на авторов.
+
+    Списочные сериализаторы заранее сообщают id авторов методом prime,
+    и при первом обращении все накопленные id проверяются одним запросом
+    с IN.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self._pending = set()
+        self._subscribed = {}
+
+    def prime(self, author_ids):
+        self._pending.update(author_id for author_id in author_ids
+                             if author_id not in self._subscribed)
+
+    def is_subscribed(self, author_id):
+        if self.user.is_anonymous or author_id is None:
+            return False
+        if author_id not in self._subscribed:
+            self._pending.add(author_id)
+            self._load()
+        return self._subscribed[author_id]
+
+    def _load(self):
+        author_ids, self._pending = self._pending, set()
+        author_ids.discard(None)
+        subscribed = set(Subscribe.objects.filter(
+            user=self.user, author_id__in=author_ids,
+        ).values_list('author_id', flat=True))
+        self._subscribed.update((author_id, author_id in subscribed)
+                                for author_id in author_ids)
+
+
+def get_subscription_loader(context):
+    """Загрузчик, общий для всех сериализаторов с этим контекстом."""
+    loader = context.get(SUBSCRIPTION_LOADER)
+    if loader is None:
+        loader = context[SUBSCRIPTION_LOADER] = SubscriptionLoader(
+            context['request'].user)
+    return loader
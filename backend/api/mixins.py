@@ -1,3 +1,6 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_vary_headers
 from rest_framework import status
 from rest_framework.response import Response
 
@@ -17,3 +20,43 @@ class SubscriptionsManagerMixin:
         return Response(
             {'message': message['error']},
             status=status.HTTP_400_BAD_REQUEST)
+
+
+class ConditionalGetMixin:
+    """Условные GET-запросы для list и retrieve по ETag.
+
+    Состояние ответа строится методом get_state по отфильтрованному
+    queryset до выборки и сериализации объектов.
+    """
+
+    def get_state(self, queryset):
+        """Возвращает значения, от которых зависит ответ."""
+        raise NotImplementedError
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return self.conditional_response(
+            queryset, super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.filter_queryset(self.get_queryset()).filter(
+            **{self.lookup_field: kwargs[lookup_url_kwarg]})
+        return self.conditional_response(
+            queryset, super().retrieve, request, *args, **kwargs)
+
+    def conditional_response(self, queryset, handler, request,
+                             *args, **kwargs):
+        state = self.get_state(queryset)
+        etag = '"{}"'.format(hashlib.md5(
+            f'{request.get_full_path()}|{request.accepted_renderer.format}|'
+            f'{state}'.encode()).hexdigest())
+
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if response.status_code in (status.HTTP_200_OK,
+                                    status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = etag
+            patch_vary_headers(response, ('Authorization',))
+        return response
@@ -0,0 +1,193 @@
+import base64
+import binascii
+import json
+from datetime import date
+
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Q, Window
+from django.template import loader
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+# SQLite не задает полям диапазон, а больших чисел не принимает.
+MAX_INTEGER = 2 ** 63 - 1
+
+
+class KeysetPagination(LimitOffsetPagination):
+    """Пагинация limit/offset с режимом курсора по запросу клиента.
+
+    Режим курсора включается параметром cursor (пустое значение - первая
+    страница). Страница выбирается условием по ключу сортировки queryset,
+    дополненному первичным ключом, вместо OFFSET и без подсчета объектов.
+    """
+    cursor_query_param = 'cursor'
+    cursor_template = 'rest_framework/pagination/previous_and_next.html'
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.use_cursor = self.cursor_query_param in request.query_params
+        if not self.use_cursor:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        queryset, position, reverse = self.get_cursor_queryset(queryset,
+                                                               request)
+        page = list(queryset[:self.limit + 1])
+        has_more = len(page) > self.limit
+        page = page[:self.limit]
+        if reverse:
+            page.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.page = page
+        return page
+
+    def get_cursor_queryset(self, queryset, request):
+        """queryset страницы курсора, позиция курсора и направление."""
+        self.limit = self.get_limit(request)
+        self.ordering = self.get_ordering(queryset)
+        position, reverse = self.decode_cursor(request)
+        if position is not None:
+            position = self.parse_position(queryset, position)
+
+        ordering = self.ordering
+        if reverse:
+            ordering = [self.invert(field) for field in ordering]
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(
+                self.get_position_filter(ordering, position))
+        return queryset, position, reverse
+
+    def get_page_values(self, queryset, request, fields):
+        """Значения fields объектов страницы одним запросом.
+
+        В режиме курсора добавляется объект следующей страницы, а для
+        limit/offset - общее число объектов.
+        """
+        if self.cursor_query_param in request.query_params:
+            queryset, _, _ = self.get_cursor_queryset(queryset, request)
+            return list(queryset.values_list(*fields)[:self.limit + 1])
+        limit = self.get_limit(request)
+        if limit is None:
+            return list(queryset.values_list(*fields))
+        offset = self.get_offset(request)
+        rows = list(queryset.values_list(*fields).annotate(
+            page_total=Window(Count('pk')))[offset:offset + limit])
+        if not rows and offset:
+            return [queryset.count()]
+        return rows
+
+    def get_paginated_response(self, data):
+        if not self.use_cursor:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.get_next_cursor_link(),
+            'previous': self.get_previous_cursor_link(),
+            'results': data,
+        })
+
+    def get_ordering(self, queryset):
+        ordering = list(queryset.query.order_by
+                        or queryset.model._meta.ordering)
+        pk_names = {'pk', queryset.model._meta.pk.attname}
+        if not any(field.lstrip('-') in pk_names for field in ordering):
+            descending = bool(ordering) and ordering[-1].startswith('-')
+            ordering.append('-pk' if descending else 'pk')
+        return ordering
+
+    @staticmethod
+    def invert(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    @staticmethod
+    def get_position_filter(ordering, position):
+        condition = Q()
+        equal = {}
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def get_ordering_fields(self, queryset):
+        """Поля модели или аннотаций, по которым отсортирован queryset."""
+        fields = []
+        for name in (field.lstrip('-') for field in self.ordering):
+            if name in queryset.query.annotations:
+                fields.append(queryset.query.annotations[name].output_field)
+            elif name == 'pk':
+                fields.append(queryset.model._meta.pk)
+            else:
+                fields.append(queryset.model._meta.get_field(name))
+        return fields
+
+    def parse_position(self, queryset, position):
+        """Приводит значения курсора к типам полей сортировки."""
+        values = []
+        try:
+            for field, value in zip(self.get_ordering_fields(queryset),
+                                    position):
+                value = field.to_python(value)
+                if value is None or (isinstance(value, int)
+                                     and abs(value) > MAX_INTEGER):
+                    raise ValueError
+                field.run_validators(value)
+                values.append(value)
+        except (ValidationError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def get_position(self, obj):
+        return [getattr(obj, field.lstrip('-')) for field in self.ordering]
+
+    def encode_cursor(self, position, reverse):
+        payload = json.dumps(
+            {'p': position, 'r': reverse},
+            default=lambda value: (value.isoformat()
+                                   if isinstance(value, date) else str(value)))
+        token = base64.urlsafe_b64encode(payload.encode()).decode()
+        return replace_query_param(self.request.build_absolute_uri(),
+                                   self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        token = request.query_params[self.cursor_query_param]
+        if not token:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(token.encode()))
+            position, reverse = payload['p'], bool(payload['r'])
+        except (binascii.Error, ValueError, TypeError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if (not isinstance(position, list)
+                or len(position) != len(self.ordering)):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def get_next_cursor_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.get_position(self.page[-1]), False)
+
+    def get_previous_cursor_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.get_position(self.page[0]), True)
+
+    def get_html_context(self):
+        if not self.use_cursor:
+            return super().get_html_context()
+        return {
+            'previous_url': self.get_previous_cursor_link(),
+            'next_url': self.get_next_cursor_link(),
+        }
+
+    def to_html(self):
+        if not self.use_cursor:
+            return super().to_html()
+        template = loader.get_template(self.cursor_template)
+        return template.render(self.get_html_context())
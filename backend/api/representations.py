@@ -0,0 +1,96 @@
+"""Быстрое построение представлений для сериализаторов чтения.
+
+Функции собирают словари напрямую из атрибутов моделей, минуя привязку
+полей DRF, и возвращают те же данные, что и соответствующие
+ModelSerializer.
+"""
+
+
+def file_url(file, request):
+    if not file:
+        return None
+    url = file.url
+    if request is not None:
+        return request.build_absolute_uri(url)
+    return url
+
+
+def tag_data(tag):
+    return {'id': tag.id, 'name': tag.name, 'slug': tag.slug}
+
+
+def ingredient_amount_data(amount):
+    ingredient = amount.ingredient
+    return {
+        'id': ingredient.id,
+        'name': ingredient.name,
+        'measurement_unit': ingredient.measurement_unit,
+        'amount': amount.amount,
+    }
+
+
+def author_data(user, request, is_subscribed=False):
+    if user is None:
+        return None
+    return {
+        'email': user.email,
+        'id': user.id,
+        'username': user.username,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'is_subscribed': is_subscribed,
+        'avatar': file_url(user.avatar, request),
+        **author_counters_data(user),
+    }
+
+
+def thumbnails_data(recipe, request):
+    """Миниатюры рецепта; пока их нет - исходное изображение."""
+    return {
+        'image_small': file_url(recipe.image_small or recipe.image, request),
+        'image_medium': file_url(recipe.image_medium or recipe.image,
+                                 request),
+    }
+
+
+def short_recipe_data(recipe, request):
+    return {
+        'id': recipe.id,
+        'image': file_url(recipe.image, request),
+        **thumbnails_data(recipe, request),
+        'name': recipe.name,
+        'cooking_time': recipe.cooking_time,
+    }
+
+
+def author_counters_data(user):
+    return {
+        'recipes_count': user.recipes_count,
+        'followers_count': user.followers_count,
+    }
+
+
+def recipe_counters_data(recipe):
+    return {
+        'favorites_count': recipe.favorites_count,
+        'shopping_cart_count': recipe.shopping_cart_count,
+    }
+
+
+def recipe_public_data(recipe, request):
+    """Представление рецепта без отметок конкретного пользователя."""
+    return {
+        'id': recipe.id,
+        'tags': [tag_data(tag) for tag in recipe.tags.all()],
+        'author': author_data(recipe.author, request),
+        'ingredients': [ingredient_amount_data(amount)
+                        for amount in recipe.ingredients.all()],
+        'is_favorited': False,
+        'is_in_shopping_cart': False,
+        'name': recipe.name,
+        'image': file_url(recipe.image, request),
+        **thumbnails_data(recipe, request),
+        'text': recipe.text,
+        'cooking_time': recipe.cooking_time,
+        **recipe_counters_data(recipe),
+    }
@@ -1,15 +1,32 @@
+import json
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import UploadedFile
+from django.db import transaction
+from django.http import QueryDict
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
 from recipes.models import (AmountIngredient, Cart, Favorite, Ingredient,
-                            Recipe, Tag)
+                            Recipe, ShoppingListItem, Tag)
+from recipes.pantry_search import log_recipe_change
 from users.models import Subscribe
 
+from .cache import get_public_representations
+from .images import ALLOWED_FORMATS, FORMAT_EXTENSIONS, schedule_thumbnails
+from .loaders import get_subscription_loader
+from .representations import (author_counters_data, author_data,
+                              ingredient_amount_data, recipe_counters_data,
+                              recipe_public_data, short_recipe_data,
+                              tag_data)
+
 User = get_user_model()
 
+JSON_FORM_FIELDS = ('tags', 'ingredients')
+
 
 class CustomUserCreateSerializer(UserCreateSerializer):
     class Meta:
@@ -21,6 +38,15 @@ class CustomUserCreateSerializer(UserCreateSerializer):
         }
 
 
+class UserListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        users = list(data.all() if hasattr(data, 'all') else data)
+        if self.context.get('request') is not None:
+            get_subscription_loader(self.context).prime(
+                user.id for user in users)
+        return super().to_representation(users)
+
+
 class UserProfileSerializer(UserSerializer):
     is_subscribed = serializers.SerializerMethodField()
     avatar = Base64ImageField()
@@ -28,16 +54,15 @@ class UserProfileSerializer(UserSerializer):
     class Meta:
         model = User
         fields = ('email', 'id', 'username', 'first_name', 'last_name',
-                  'password', 'is_subscribed', 'avatar')
+                  'password', 'is_subscribed', 'avatar', 'recipes_count',
+                  'followers_count')
         extra_kwargs = {
             'password': {'write_only': True, 'required': True},
         }
+        list_serializer_class = UserListSerializer
 
     def get_is_subscribed(self, obj):
-        user = self.context['request'].user
-        if user.is_authenticated:
-            return Subscribe.objects.filter(user=user, author=obj).exists()
-        return False
+        return get_subscription_loader(self.context).is_subscribed(obj.id)
 
     def validate_avatar(self, data):
         if not data:
@@ -50,6 +75,9 @@ class TagSerializer(serializers.ModelSerializer):
         model = Tag
         fields = ('id', 'name', 'slug')
 
+    def to_representation(self, instance):
+        return tag_data(instance)
+
 
 class IngredientSerializer(serializers.ModelSerializer):
     class Meta:
@@ -57,13 +85,53 @@ class IngredientSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class ThumbnailField(serializers.ImageField):
+    """Миниатюра рецепта; пока ее нет - исходное изображение."""
+
+    def __init__(self, **kwargs):
+        super().__init__(read_only=True, **kwargs)
+
+    def get_attribute(self, instance):
+        return super().get_attribute(instance) or instance.image
+
+
+class RecipeImageField(Base64ImageField):
+    """Изображение в base64 или файлом из multipart/form-data."""
+
+    def to_internal_value(self, data):
+        if not isinstance(data, UploadedFile):
+            return super().to_internal_value(data)
+        if data.size > settings.RECIPE_IMAGE_MAX_UPLOAD_SIZE:
+            raise ValidationError(
+                'Изображение больше '
+                f'{settings.RECIPE_IMAGE_MAX_UPLOAD_SIZE // 1024} КБ.')
+        image = serializers.ImageField.to_internal_value(self, data)
+        image_format = image.image.format
+        if image_format not in ALLOWED_FORMATS:
+            raise ValidationError(f'Формат {image_format} не поддерживается.')
+        width, height = image.image.size
+        if width * height > settings.IMAGE_MAX_PIXELS:
+            raise ValidationError('Слишком большое разрешение изображения.')
+        # Расширение берется из формата, а не из имени файла клиента.
+        image.name = 'image.' + FORMAT_EXTENSIONS.get(image_format,
+                                                      image_format.lower())
+        return image
+
+
 class ShortRecipeSerializer(serializers.ModelSerializer):
+    image_small = ThumbnailField()
+    image_medium = ThumbnailField()
+
     class Meta:
         model = Recipe
         fields = (
-            'id', 'image', 'name', 'cooking_time'
+            'id', 'image', 'image_small', 'image_medium', 'name',
+            'cooking_time'
         )
 
+    def to_representation(self, instance):
+        return short_recipe_data(instance, self.context.get('request'))
+
 
 class RecipeInFavoriteerializer(serializers.ModelSerializer):
     class Meta:
@@ -91,20 +159,36 @@ class UserInSubscribeSerializer(serializers.ModelSerializer):
         model = Subscribe
         fields = ('user', 'author')
 
-    def to_representation(self, instance):
-        request = self.context.get('request')
+    @staticmethod
+    def get_recipes_limit(request):
         recipes_limit = request.query_params.get('recipes_limit')
-        recipes = instance.author.recipes.all()
-        if recipes_limit:
-            recipes_limit = recipes[:int(recipes_limit)]
-
-        user_data = UserProfileSerializer(instance.author,
-                                          context=self.context).data
+        if not recipes_limit:
+            return None
+        try:
+            recipes_limit = int(recipes_limit)
+        except ValueError:
+            recipes_limit = -1
+        if recipes_limit < 0:
+            raise ValidationError(
+                {'recipes_limit': 'Ожидается неотрицательное целое число.'})
+        return recipes_limit
 
+    def to_representation(self, instance):
+        request = self.context.get('request')
+        author = instance.author
+        recipes = getattr(author, 'subscription_recipes', None)
+        if recipes is None:
+            recipes = author.recipes.all()
+            recipes_limit = self.get_recipes_limit(request)
+            if recipes_limit is not None:
+                recipes = recipes[:recipes_limit]
+            # Счетчики автора могли измениться при создании подписки.
+            author.refresh_from_db(fields=('recipes_count',
+                                           'followers_count'))
+
+        user_data = author_data(author, request, is_subscribed=True)
         user_data['recipes'] = ShortRecipeSerializer(
-            recipes_limit, many=True,
-            context=self.context).data
-        user_data['recipes_count'] = len(user_data['recipes'])
+            recipes, many=True, context=self.context).data
         return user_data
 
 
@@ -118,6 +202,22 @@ class IngredientInRecipeSerializer(serializers.ModelSerializer):
         model = AmountIngredient
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
+    def to_representation(self, instance):
+        return ingredient_amount_data(instance)
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        if self.context.get('request') is None:
+            return super().to_representation(data)
+        recipes = list(data.all() if hasattr(data, 'all') else data)
+        get_subscription_loader(self.context).prime(
+            recipe.author_id for recipe in recipes)
+        public_data = get_public_representations(
+            recipes, self.context['request'], self.child.render_public)
+        return [self.child.add_viewer_fields(recipe, public)
+                for recipe, public in zip(recipes, public_data)]
+
 
 class RecipeSerializer(serializers.ModelSerializer):
     author = UserProfileSerializer(read_only=True)
@@ -125,6 +225,8 @@ class RecipeSerializer(serializers.ModelSerializer):
     ingredients = IngredientInRecipeSerializer(many=True,
                                                read_only=True)
     image = Base64ImageField()
+    image_small = ThumbnailField()
+    image_medium = ThumbnailField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
 
@@ -132,16 +234,50 @@ class RecipeSerializer(serializers.ModelSerializer):
         model = Recipe
         fields = (
             'id', 'tags', 'author', 'ingredients', 'is_favorited',
-            'is_in_shopping_cart', 'name', 'image', 'text', 'cooking_time'
+            'is_in_shopping_cart', 'name', 'image', 'image_small',
+            'image_medium', 'text', 'cooking_time', 'favorites_count',
+            'shopping_cart_count'
         )
+        list_serializer_class = RecipeListSerializer
+
+    def render_public(self, instance):
+        return recipe_public_data(instance, self.context.get('request'))
+
+    def add_viewer_fields(self, instance, public):
+        """Дополняет кэшированное представление отметками пользователя.
+
+        Счетчики тоже берутся из экземпляра: они меняются без смены
+        версии рецепта.
+        """
+        data = dict(public, **recipe_counters_data(instance))
+        data['is_favorited'] = self.get_is_favorited(instance)
+        data['is_in_shopping_cart'] = self.get_is_in_shopping_cart(instance)
+        if data['author'] is not None:
+            data['author'] = dict(
+                data['author'],
+                **author_counters_data(instance.author),
+                is_subscribed=self.fields['author'].get_is_subscribed(
+                    instance.author))
+        return data
+
+    def to_representation(self, instance):
+        if self.context.get('request') is None:
+            return super().to_representation(instance)
+        public, = get_public_representations(
+            [instance], self.context['request'], self.render_public)
+        return self.add_viewer_fields(instance, public)
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
         return Recipe.objects.filter(favorites__user=user, id=obj.id).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
@@ -153,7 +289,7 @@ class CreateRecipesSerializer(serializers.ModelSerializer):
     tags = serializers.PrimaryKeyRelatedField(queryset=Tag.objects.all(),
                                               many=True)
     ingredients = serializers.ListField(child=serializers.DictField())
-    image = Base64ImageField()
+    image = RecipeImageField()
 
     class Meta:
         model = Recipe
@@ -162,6 +298,23 @@ class CreateRecipesSerializer(serializers.ModelSerializer):
             'cooking_time', 'author'
         )
 
+    def to_internal_value(self, data):
+        if isinstance(data, QueryDict):
+            data = self.parse_form(data)
+        return super().to_internal_value(data)
+
+    @staticmethod
+    def parse_form(data):
+        """Поля multipart/form-data; теги и ингредиенты - строки JSON."""
+        data = data.dict()
+        for field in JSON_FORM_FIELDS:
+            if field in data:
+                try:
+                    data[field] = json.loads(data[field])
+                except ValueError:
+                    raise ValidationError({field: 'Ожидается JSON.'})
+        return data
+
     def create_ingredients(self, recipe, ingredients_data):
         ingredient_objects = [
             AmountIngredient(
@@ -172,6 +325,7 @@ class CreateRecipesSerializer(serializers.ModelSerializer):
             for ingredient_data in ingredients_data
         ]
         AmountIngredient.objects.bulk_create(ingredient_objects)
+        log_recipe_change(recipe.id)
 
     def validate_image(self, data):
         if not data:
@@ -217,23 +371,36 @@ class CreateRecipesSerializer(serializers.ModelSerializer):
 
         return data
 
+    @transaction.atomic
     def create(self, validated_data):
         tags_data = validated_data.pop('tags')
         ingredients_data = validated_data.pop('ingredients')
         recipe = Recipe.objects.create(**validated_data)
         recipe.tags.set(tags_data)
         self.create_ingredients(recipe, ingredients_data)
+        schedule_thumbnails(recipe)
+        # Счетчик рецептов автора увеличен сигналом в обход экземпляра.
+        recipe.author.refresh_from_db(fields=('recipes_count',))
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         tags_data = validated_data.pop('tags')
         ingredients_data = validated_data.pop('ingredients')
+        if 'image' in validated_data:
+            validated_data.update(image_small='', image_medium='')
         updated_instance = super().update(instance, validated_data)
+        if 'image' in validated_data:
+            schedule_thumbnails(updated_instance)
         updated_instance.tags.set(tags_data)
 
+        ShoppingListItem.objects.apply_recipe(updated_instance.pk, -1)
         AmountIngredient.objects.filter(recipe=updated_instance).delete()
 
         self.create_ingredients(updated_instance, ingredients_data)
+        ShoppingListItem.objects.apply_recipe(updated_instance.pk, 1)
+        Recipe.objects.filter(pk=instance.pk).touch()
+        instance.refresh_from_db(fields=('version',))
         return instance
 
     def to_representation(self, instance):
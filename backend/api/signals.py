@@ -0,0 +1,12 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.models import Tag
+
+from .cache import reset_tag_slug_map
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def reset_tag_slug_map_on_tag_change(sender, **kwargs):
+    reset_tag_slug_map()
@@ -0,0 +1,623 @@
+import base64
+import json
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.db.models import Prefetch
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.serializers import ModelSerializer
+from rest_framework.test import APIClient, APIRequestFactory
+
+from recipes import ingredient_search, pantry_search
+from recipes.models import (AmountIngredient, Favorite, Ingredient, Recipe,
+                            ShoppingListItem, StoredFile, Tag)
+from recipes.short_links import CODE_LENGTH, encode_short_link
+from users.models import Subscribe, User
+
+from .representations import recipe_public_data
+from .serializers import RecipeSerializer, ShortRecipeSerializer, TagSerializer
+
+MEDIA_ROOT = tempfile.mkdtemp()
+PNG = ('data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAIAAACQd1Pe'
+       'AAAADElEQVR4nGP4z8AAAAMBAQDJ/pLvAAAAAElFTkSuQmCC')
+
+
+def make_cursor(position, reverse=False):
+    payload = json.dumps({'p': position, 'r': reverse}).encode()
+    return base64.urlsafe_b64encode(payload).decode()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ApiTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='cook@example.com', username='cook', password='pass-12345',
+            first_name='Иван', last_name='Иванов')
+        cls.tag = Tag.objects.create(name='Завтрак', slug='breakfast')
+        cls.ingredient = Ingredient.objects.create(
+            name='Мука', measurement_unit='г')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.anon = APIClient()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_recipes(self, count, author=None):
+        author = author or self.user
+        start = Recipe.objects.count()
+        for number in range(start, start + count):
+            recipe = Recipe.objects.create(
+                author=author, name=f'Рецепт {number}', text='Описание',
+                cooking_time=10, image='recipe_images/test.png')
+            recipe.tags.add(self.tag)
+            recipe.ingredients.create(ingredient=self.ingredient, amount=100)
+
+
+class KeysetPaginationTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.create_recipes(3)
+
+    def get_page(self, cursor, **params):
+        return self.anon.get('/api/recipes/', {'cursor': cursor, **params})
+
+    def test_cursor_pages(self):
+        response = self.get_page('', limit=2)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 2)
+        next_page = self.anon.get(response.data['next'])
+        self.assertEqual(len(next_page.data['results']), 1)
+
+    def test_invalid_cursor_values(self):
+        for position in (['garbage', 1], [{'x': 1}, 1], [None, 1],
+                         ['2024-01-01T00:00:00+00:00', 'id'],
+                         ['2024-01-01T00:00:00+00:00', 10 ** 30]):
+            with self.subTest(position=position):
+                response = self.get_page(make_cursor(position))
+                self.assertEqual(response.status_code, 404)
+
+    def test_invalid_annotation_cursor_values(self):
+        response = self.get_page(make_cursor(['first', 1]),
+                                 have=str(self.ingredient.id))
+        self.assertEqual(response.status_code, 404)
+
+    def test_malformed_cursor(self):
+        for cursor in ('%%%', make_cursor([1]),
+                       base64.urlsafe_b64encode(b'[]').decode()):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.get_page(cursor).status_code, 404)
+
+
+class ConditionalGetTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.create_recipes(3)
+
+    def assertNotModified(self, client, url, etag, expected=True):
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304 if expected else 200)
+
+    def test_not_modified(self):
+        for client in (self.anon, self.client):
+            for url in ('/api/recipes/', '/api/recipes/?limit=1&offset=1',
+                        '/api/recipes/?cursor=&limit=2',
+                        f'/api/recipes/{Recipe.objects.first().pk}/'):
+                with self.subTest(url=url):
+                    response = client.get(url)
+                    self.assertNotIn('Last-Modified', response)
+                    self.assertNotModified(client, url, response['ETag'])
+
+    def test_deleted_recipe_changes_etag(self):
+        etag = self.anon.get('/api/recipes/')['ETag']
+        Recipe.objects.first().delete()
+        self.assertNotModified(self.anon, '/api/recipes/', etag, False)
+
+    def test_ordering_key_changes_etag(self):
+        url = '/api/recipes/?ordering=popular'
+        etag = self.anon.get(url)['ETag']
+        Recipe.objects.filter(pk=Recipe.objects.last().pk).update(
+            popularity=10)
+        self.assertNotModified(self.anon, url, etag, False)
+
+    def test_favorite_changes_etag(self):
+        etag = self.client.get('/api/recipes/')['ETag']
+        self.client.post(
+            f'/api/recipes/{Recipe.objects.first().pk}/favorite/')
+        self.assertNotModified(self.client, '/api/recipes/', etag, False)
+
+
+class PantrySearchTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        patcher = mock.patch('api.filters.pantry_index',
+                             pantry_search.PantryIndex())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.create_recipes(2)
+
+    def search(self):
+        response = self.anon.get('/api/recipes/',
+                                 {'have': self.ingredient.id, 'limit': 10})
+        return {recipe['id'] for recipe in response.data['results']}
+
+    def log_changes(self, recipe_ids):
+        with self.captureOnCommitCallbacks(execute=True):
+            for recipe_id in recipe_ids:
+                pantry_search.log_recipe_change(recipe_id)
+
+    def test_invalid_ingredient_ids(self):
+        for value in ('a,b', '99999999999999999999', '-1', '0'):
+            with self.subTest(value=value):
+                response = self.anon.get('/api/recipes/', {'have': value})
+                self.assertEqual(response.status_code, 400)
+
+    def test_new_recipe_after_log_reset(self):
+        recipe_ids = set(Recipe.objects.values_list('id', flat=True))
+        self.log_changes(recipe_ids)
+        self.assertEqual(len(self.search()), 2)
+        # Счетчик пропадает из кэша и снова доходит до номера индекса.
+        cache.delete(pantry_search.SEQUENCE_KEY)
+        with self.captureOnCommitCallbacks(execute=True), \
+                mock.patch('api.serializers.schedule_thumbnails'):
+            response = self.client.post('/api/recipes/', {
+                'name': 'Новый рецепт', 'text': 'Описание',
+                'cooking_time': 5, 'image': PNG, 'tags': [self.tag.id],
+                'ingredients': [{'id': self.ingredient.id, 'amount': 1}],
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.log_changes([min(recipe_ids)])
+        self.assertEqual(self.search(), recipe_ids | {response.data['id']})
+
+
+class IngredientSearchTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        for name in ('Морская соль', 'Сола', 'Соль', 'Соль йодированная'):
+            Ingredient.objects.create(name=name, measurement_unit='г')
+
+    def search(self, name):
+        response = self.anon.get('/api/ingredients/', {'name': name})
+        self.assertEqual(response.status_code, 200)
+        return [ingredient['name'] for ingredient in response.data]
+
+    def test_ranking(self):
+        self.assertEqual(self.search('соль'), [
+            'Соль', 'Соль йодированная', 'Морская соль', 'Сола'])
+        self.assertEqual(self.search('ль'), [
+            'Соль', 'Соль йодированная', 'Морская соль'])
+
+    def test_rebuild_on_ingredient_save(self):
+        self.assertNotIn('Соль каменная', self.search('соль'))
+        ingredient = Ingredient.objects.create(
+            name='Соль каменная', measurement_unit='г')
+        self.assertIn('Соль каменная', self.search('соль'))
+        ingredient.name = 'Сахар'
+        ingredient.save()
+        self.assertNotIn('Соль каменная', self.search('соль'))
+        self.assertIn('Сахар', self.search('сах'))
+
+    def test_generation_check_throttled(self):
+        index = ingredient_search.IngredientIndex()
+        with mock.patch('time.monotonic', return_value=100):
+            self.assertEqual(len(index.search('соль', 10)), 4)
+            Ingredient.objects.create(name='Соль крупная',
+                                      measurement_unit='г')
+            with self.assertNumQueries(0):
+                self.assertEqual(len(index.search('соль', 10)), 4)
+        with mock.patch('time.monotonic', return_value=101):
+            self.assertEqual(len(index.search('соль', 10)), 5)
+
+
+class QueryBudgetTests(ApiTestCase):
+    """Число запросов не зависит от размера страницы."""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.author = User.objects.create_user(
+            email='chef@example.com', username='chef',
+            password='pass-12345', first_name='Петр', last_name='Петров')
+        self.create_recipes(6)
+        self.create_recipes(6, author=self.author)
+        Subscribe.objects.create(user=self.user, author=self.author)
+        Subscribe.objects.create(user=self.author, author=self.user)
+
+    def assertQueryBudget(self, client, url, queries):
+        cache.clear()
+        with self.assertNumQueries(queries):
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_recipes(self):
+        recipe_id = Recipe.objects.first().pk
+        for client, list_queries in ((self.anon, 5), (self.client, 6)):
+            for limit in (2, 10):
+                with self.subTest(client=client, limit=limit):
+                    response = self.assertQueryBudget(
+                        client, f'/api/recipes/?limit={limit}', list_queries)
+                    self.assertEqual(len(response.data['results']), limit)
+            with self.subTest(client=client, action='retrieve'):
+                self.assertQueryBudget(
+                    client, f'/api/recipes/{recipe_id}/', list_queries - 1)
+
+    def test_users(self):
+        for client, queries in ((self.anon, 2), (self.client, 3)):
+            for limit in (1, 3):
+                with self.subTest(client=client, limit=limit):
+                    self.assertQueryBudget(
+                        client, f'/api/users/?limit={limit}', queries)
+
+    def test_subscriptions(self):
+        self.other = User.objects.create_user(
+            email='baker@example.com', username='baker',
+            password='pass-12345', first_name='Анна', last_name='Смирнова')
+        self.create_recipes(3, author=self.other)
+        Subscribe.objects.create(user=self.user, author=self.other)
+        for limit in (1, 2):
+            with self.subTest(limit=limit):
+                response = self.assertQueryBudget(
+                    self.client, '/api/users/subscriptions/'
+                    f'?limit={limit}&recipes_limit=2', 3)
+                self.assertEqual(len(response.data['results']), limit)
+                for author in response.data['results']:
+                    self.assertEqual(len(author['recipes']), 2)
+                    self.assertTrue(author['is_subscribed'])
+        response = self.client.get('/api/users/subscriptions/')
+        self.assertEqual(
+            sorted(author['recipes_count']
+                   for author in response.data['results']), [3, 6])
+
+    def test_is_subscribed(self):
+        response = self.client.get('/api/users/?limit=10')
+        self.assertEqual(
+            {user['id']: user['is_subscribed']
+             for user in response.data['results']},
+            {self.user.id: False, self.author.id: True})
+        response = self.client.get('/api/recipes/?limit=20')
+        self.assertEqual(
+            {recipe['author']['id']: recipe['author']['is_subscribed']
+             for recipe in response.data['results']},
+            {self.user.id: False, self.author.id: True})
+
+
+class RepresentationTests(ApiTestCase):
+    """Быстрые представления совпадают с выводом сериализаторов DRF."""
+
+    def setUp(self):
+        super().setUp()
+        self.create_recipes(3)
+        self.request = Request(APIRequestFactory().get('/api/recipes/'))
+        self.recipes = Recipe.objects.select_related(
+            'author').prefetch_related('tags', Prefetch(
+                'ingredients',
+                AmountIngredient.objects.select_related('ingredient')))
+
+    def assertSameOutput(self, fast, slow):
+        self.assertEqual(json.dumps(fast), json.dumps(slow))
+
+    def test_recipe(self):
+        serializer = RecipeSerializer(context={'request': self.request})
+        for recipe in self.recipes:
+            slow = ModelSerializer.to_representation(serializer, recipe)
+            slow['author']['is_subscribed'] = False
+            slow['is_favorited'] = slow['is_in_shopping_cart'] = False
+            fast = recipe_public_data(recipe, self.request)
+            self.assertSameOutput(fast, slow)
+
+    def test_short_recipe_and_tags(self):
+        for recipe in self.recipes:
+            serializer = ShortRecipeSerializer(
+                recipe, context={'request': self.request})
+            self.assertSameOutput(
+                serializer.data,
+                ModelSerializer.to_representation(serializer, recipe))
+            for tag in recipe.tags.all():
+                serializer = TagSerializer(tag)
+                self.assertSameOutput(
+                    serializer.data,
+                    ModelSerializer.to_representation(serializer, tag))
+
+
+class RecipeVersionTests(ApiTestCase):
+    def test_save_of_stale_instance_changes_version(self):
+        self.create_recipes(1)
+        recipe = Recipe.objects.get()
+        other_tag = Tag.objects.create(name='Ужин', slug='dinner')
+        Recipe.objects.get().tags.add(other_tag)
+        url = f'/api/recipes/{recipe.pk}/'
+        etag = self.anon.get(url)['ETag']
+        recipe.name = 'Новое имя'
+        recipe.save()
+        self.assertEqual(recipe.version,
+                         Recipe.objects.get().version)
+        response = self.anon.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['name'], 'Новое имя')
+
+
+class TagFilterTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.dinner = Tag.objects.create(name='Ужин', slug='dinner')
+        self.create_recipes(3)
+        for recipe in Recipe.objects.all():
+            recipe.tags.add(self.dinner)
+
+    def filter_ids(self, *slugs):
+        response = self.anon.get('/api/recipes/',
+                                 {'tags': slugs, 'limit': 10})
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def test_several_tags_without_duplicates(self):
+        recipe_ids = self.filter_ids('breakfast', 'dinner')
+        self.assertEqual(len(recipe_ids), len(set(recipe_ids)))
+        self.assertEqual(set(recipe_ids),
+                         set(Recipe.objects.values_list('id', flat=True)))
+
+    def test_unknown_tag(self):
+        self.assertEqual(self.filter_ids('unknown'), [])
+        self.assertEqual(len(self.filter_ids('unknown', 'dinner')), 3)
+
+    def test_slug_map_reset_on_tag_change(self):
+        self.assertEqual(self.filter_ids('lunch'), [])
+        lunch = Tag.objects.create(name='Обед', slug='lunch')
+        Recipe.objects.first().tags.add(lunch)
+        self.assertEqual(len(self.filter_ids('lunch')), 1)
+        self.dinner.slug = 'supper'
+        self.dinner.save()
+        self.assertEqual(self.filter_ids('dinner'), [])
+        self.assertEqual(len(self.filter_ids('supper')), 3)
+        self.dinner.delete()
+        self.assertEqual(self.filter_ids('supper'), [])
+
+
+class ShoppingListTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.sugar = Ingredient.objects.create(name='Сахар',
+                                               measurement_unit='г')
+        self.other = User.objects.create_user(
+            email='guest@example.com', username='guest',
+            password='pass-12345', first_name='Олег', last_name='Олегов')
+        self.other_client = APIClient()
+        self.other_client.force_authenticate(self.other)
+        self.create_recipes(3)
+        self.recipes = list(Recipe.objects.order_by('id'))
+
+    def assertTotals(self):
+        actual = {
+            (user_id, ingredient_id): total_amount
+            for user_id, ingredient_id, total_amount in
+            ShoppingListItem.objects.values_list(
+                'user_id', 'ingredient_id', 'total_amount')
+        }
+        self.assertEqual(actual,
+                         dict(ShoppingListItem.objects.expected_totals()))
+        call_command('rebuild_shopping_lists', '--check', stdout=StringIO())
+
+    def cart_url(self, recipe):
+        return f'/api/recipes/{recipe.pk}/shopping_cart/'
+
+    def test_totals_follow_carts_and_recipes(self):
+        first, second, third = self.recipes
+        for client in (self.client, self.other_client):
+            for recipe in (first, second):
+                self.assertEqual(
+                    client.post(self.cart_url(recipe)).status_code, 201)
+        self.client.post(self.cart_url(third))
+        self.assertTotals()
+        self.assertEqual(ShoppingListItem.objects.get(
+            user=self.user, ingredient=self.ingredient).total_amount, 300)
+
+        self.assertEqual(
+            self.client.delete(self.cart_url(second)).status_code, 204)
+        self.assertTotals()
+
+        response = self.client.patch(f'/api/recipes/{first.pk}/', {
+            'name': first.name, 'text': 'Новое описание', 'cooking_time': 5,
+            'tags': [self.tag.id],
+            'ingredients': [{'id': self.ingredient.id, 'amount': 40},
+                            {'id': self.sugar.id, 'amount': 15}],
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTotals()
+        self.assertEqual(ShoppingListItem.objects.get(
+            user=self.other, ingredient=self.sugar).total_amount, 15)
+
+        self.assertEqual(self.client.delete(
+            f'/api/recipes/{first.pk}/').status_code, 204)
+        self.assertTotals()
+        self.assertFalse(ShoppingListItem.objects.filter(
+            ingredient=self.sugar).exists())
+
+    def test_check_command_reports_mismatch(self):
+        self.client.post(self.cart_url(self.recipes[0]))
+        ShoppingListItem.objects.update(total_amount=1)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_shopping_lists', '--check',
+                         stdout=StringIO())
+        call_command('rebuild_shopping_lists', stdout=StringIO())
+        self.assertTotals()
+
+
+@mock.patch('api.serializers.schedule_thumbnails')
+class CounterTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user(
+            email='chef@example.com', username='chef',
+            password='pass-12345', first_name='Петр', last_name='Петров')
+        self.author_client = APIClient()
+        self.author_client.force_authenticate(self.author)
+
+    def create_recipe(self):
+        response = self.author_client.post('/api/recipes/', {
+            'name': 'Блины', 'text': 'Описание', 'cooking_time': 20,
+            'image': PNG, 'tags': [self.tag.id],
+            'ingredients': [{'id': self.ingredient.id, 'amount': 200}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return Recipe.objects.get(pk=response.data['id'])
+
+    def assertCounters(self, recipe, favorites, carts, recipes, followers):
+        recipe.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual(
+            (recipe.favorites_count, recipe.shopping_cart_count,
+             self.author.recipes_count, self.author.followers_count),
+            (favorites, carts, recipes, followers))
+
+    def test_counters_follow_api(self, schedule_thumbnails):
+        recipe = self.create_recipe()
+        self.assertCounters(recipe, 0, 0, 1, 0)
+        self.client.post(f'/api/recipes/{recipe.pk}/favorite/')
+        self.client.post(f'/api/recipes/{recipe.pk}/shopping_cart/')
+        self.client.post(f'/api/users/{self.author.pk}/subscribe/')
+        self.assertCounters(recipe, 1, 1, 1, 1)
+        self.client.delete(f'/api/recipes/{recipe.pk}/favorite/')
+        self.client.delete(f'/api/recipes/{recipe.pk}/shopping_cart/')
+        self.client.delete(f'/api/users/{self.author.pk}/subscribe/')
+        self.assertCounters(recipe, 0, 0, 1, 0)
+        self.assertEqual(self.author_client.delete(
+            f'/api/recipes/{recipe.pk}/').status_code, 204)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 0)
+
+    def test_reconcile_repairs_drift(self, schedule_thumbnails):
+        recipe = self.create_recipe()
+        self.client.post(f'/api/recipes/{recipe.pk}/favorite/')
+        self.client.post(f'/api/users/{self.author.pk}/subscribe/')
+        Recipe.objects.update(favorites_count=7, shopping_cart_count=3)
+        User.objects.filter(pk=self.author.pk).update(
+            recipes_count=0, followers_count=5)
+        call_command('reconcile_counters', stdout=StringIO())
+        self.assertCounters(recipe, 1, 0, 1, 1)
+
+    def test_counters_do_not_go_negative(self, schedule_thumbnails):
+        recipe = self.create_recipe()
+        self.client.post(f'/api/recipes/{recipe.pk}/favorite/')
+        self.client.post(f'/api/users/{self.author.pk}/subscribe/')
+        Recipe.objects.update(favorites_count=0)
+        User.objects.filter(pk=self.author.pk).update(followers_count=0)
+        self.client.delete(f'/api/recipes/{recipe.pk}/favorite/')
+        self.client.delete(f'/api/users/{self.author.pk}/subscribe/')
+        self.assertCounters(recipe, 0, 0, 1, 0)
+
+    def test_removed_mark_subtracts_decayed_weight(self, schedule_thumbnails):
+        recipe = self.create_recipe()
+        half_life = settings.POPULARITY_HALF_LIFE_HOURS
+        weight = settings.POPULARITY_WEIGHTS['favorite']
+        self.client.post(f'/api/recipes/{recipe.pk}/favorite/')
+        Favorite.objects.update(
+            added_at=timezone.now() - timedelta(hours=half_life))
+        Recipe.objects.decay_popularity(half_life)
+        self.author_client.post(f'/api/recipes/{recipe.pk}/favorite/')
+        recipe.refresh_from_db()
+        self.assertAlmostEqual(recipe.popularity, weight / 2 + weight)
+        self.client.delete(f'/api/recipes/{recipe.pk}/favorite/')
+        recipe.refresh_from_db()
+        self.assertAlmostEqual(recipe.popularity, weight, places=3)
+
+
+class ShortLinkTests(ApiTestCase):
+    def test_codes_are_unique(self):
+        codes = [encode_short_link(pk) for pk in range(1, 100001)]
+        self.assertEqual(len(set(codes)), len(codes))
+        self.assertTrue(all(len(code) == CODE_LENGTH for code in codes))
+
+    def test_code_is_assigned_once(self):
+        self.create_recipes(2)
+        first, second = Recipe.objects.order_by('id')
+        self.assertEqual(first.short_link, encode_short_link(first.pk))
+        self.assertNotEqual(first.short_link, second.short_link)
+        code = first.short_link
+        first.name = 'Другое название'
+        first.save()
+        first.refresh_from_db()
+        self.assertEqual(first.short_link, code)
+
+    @mock.patch('api.views.short_link_clicks')
+    def test_missing_code_resolves_after_creation(self, clicks):
+        next_pk = (Recipe.objects.order_by('-pk').values_list(
+            'pk', flat=True).first() or 0) + 1
+        code = encode_short_link(next_pk)
+        self.assertEqual(self.anon.get(f'/s/{code}/').status_code, 404)
+        self.create_recipes(1)
+        response = self.anon.get(f'/s/{code}/')
+        self.assertRedirects(response, f'/recipes/{next_pk}',
+                             fetch_redirect_response=False)
+        clicks.add.assert_called_once_with(next_pk)
+
+
+@mock.patch('api.serializers.schedule_thumbnails')
+class StoredFileTests(ApiTestCase):
+    def create_recipe(self, name):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/recipes/', {
+                'name': name, 'text': 'Описание', 'cooking_time': 5,
+                'image': PNG, 'tags': [self.tag.id],
+                'ingredients': [{'id': self.ingredient.id, 'amount': 1}],
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return Recipe.objects.get(pk=response.data['id'])
+
+    def delete_recipe(self, recipe):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/recipes/{recipe.pk}/')
+
+    def test_identical_uploads_share_file(self, schedule_thumbnails):
+        first = self.create_recipe('Первый')
+        second = self.create_recipe('Второй')
+        name = first.image.name
+        self.assertEqual(second.image.name, name)
+        self.assertEqual(StoredFile.objects.get(name=name).references, 2)
+
+        self.delete_recipe(first)
+        self.assertEqual(StoredFile.objects.get(name=name).references, 1)
+        self.assertTrue(default_storage.exists(name))
+
+        self.delete_recipe(second)
+        self.assertFalse(StoredFile.objects.filter(name=name).exists())
+        self.assertFalse(default_storage.exists(name))
+
+    def test_file_deleted_during_upload_is_written_again(
+            self, schedule_thumbnails):
+        first = self.create_recipe('Первый')
+        name = first.image.name
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.delete(f'/api/recipes/{first.pk}/')
+        exists = default_storage.exists
+
+        def delete_after_check(path):
+            # Удаление файла без ссылок успевает пройти сразу после
+            # проверки его наличия новой загрузкой.
+            result = exists(path)
+            while callbacks:
+                callbacks.pop()()
+            return result
+
+        with mock.patch.object(default_storage, 'exists',
+                               side_effect=delete_after_check):
+            second = self.create_recipe('Второй')
+        self.assertEqual(second.image.name, name)
+        self.assertTrue(default_storage.exists(name))
+        self.assertEqual(StoredFile.objects.get(name=name).references, 1)
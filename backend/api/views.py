@@ -1,38 +1,48 @@
-import base64
 from urllib.parse import urljoin
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.core.files.base import ContentFile
-from django.db.models import Sum
-from django.shortcuts import get_object_or_404, redirect
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Prefetch, Value
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import redirect
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from rest_framework import status
 from rest_framework.decorators import action
-from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
 from rest_framework.permissions import (IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
 from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 
+from recipes.ingredient_search import ingredient_index
 from recipes.models import (AmountIngredient, Cart, Favorite, Ingredient,
                             Recipe, Tag)
+from recipes.short_links import short_link_clicks, short_link_resolver
 from users.models import Subscribe
 
+from .exports import EXPORT_FORMATS, IgnoreClientContentNegotiation
 from .filters import IngredientFilter, RecipeFilter
-from .mixins import SubscriptionsManagerMixin
+from .images import decode_image, save_avatar
+from .mixins import ConditionalGetMixin, SubscriptionsManagerMixin
+from .pagination import KeysetPagination
 from .permissions import IsAuthorOrReadOnly
 from .serializers import (CreateRecipesSerializer, IngredientSerializer,
                           RecipeInCartSerializer, RecipeInFavoriteerializer,
-                          RecipeSerializer, TagSerializer,
-                          UserInSubscribeSerializer)
+                          RecipeSerializer, ShortRecipeSerializer,
+                          TagSerializer, UserInSubscribeSerializer)
 
 User = get_user_model()
 
 
 def redirect_short_link(request, short_link):
-    recipe = get_object_or_404(Recipe, short_link=short_link)
-    return redirect(f'/recipes/{recipe.id}')
+    recipe_id = short_link_resolver.resolve(short_link)
+    if recipe_id is None:
+        raise Http404
+    short_link_clicks.add(recipe_id)
+    return redirect(f'/recipes/{recipe_id}')
 
 
 class IngredientsViewSet(ReadOnlyModelViewSet):
@@ -43,6 +53,13 @@ class IngredientsViewSet(ReadOnlyModelViewSet):
     search_fields = 'name'
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name:
+            return Response(ingredient_index.search(
+                name, settings.INGREDIENT_SEARCH_LIMIT))
+        return super().list(request, *args, **kwargs)
+
 
 class TagsViewSet(ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
@@ -51,7 +68,7 @@ class TagsViewSet(ReadOnlyModelViewSet):
 
 
 class CustomUserViewSet(UserViewSet, SubscriptionsManagerMixin):
-    pagination_class = LimitOffsetPagination
+    pagination_class = KeysetPagination
 
     @action(detail=False,
             methods=['GET'],
@@ -70,11 +87,13 @@ class CustomUserViewSet(UserViewSet, SubscriptionsManagerMixin):
         if not avatar_base64:
             return Response({"Вы не загрузили аватар!"},
                             status=status.HTTP_400_BAD_REQUEST)
-        format, imgstr = avatar_base64.split(';base64,')
-        ext = format.split('/')[-1]
-        img_data = base64.b64decode(imgstr)
+        try:
+            content = decode_image(avatar_base64,
+                                   settings.AVATAR_MAX_UPLOAD_SIZE)
+        except ValidationError as error:
+            raise ValidationError({'avatar': error.detail})
 
-        user.avatar.save(f'avatar.{ext}', ContentFile(img_data), save=True)
+        save_avatar(user, content)
         avatar_url = request.build_absolute_uri(user.avatar.url)
 
         return Response({"avatar": avatar_url}, status=status.HTTP_200_OK)
@@ -90,12 +109,14 @@ class CustomUserViewSet(UserViewSet, SubscriptionsManagerMixin):
     @action(detail=True,
             methods=['POST'],
             permission_classes=[IsAuthenticated])
+    @transaction.atomic
     def subscribe(self, request, *args, **kwargs):
         data = {'user': request.user.id, 'author': self.get_object().id}
         return self.add_subscribe(
             UserInSubscribeSerializer(data=data, context={'request': request}))
 
     @subscribe.mapping.delete
+    @transaction.atomic
     def unsubscribe(self, request, id=None):
         filter_set = {'user': request.user, 'author': self.get_object()}
         message = {'success': 'Подписка успешно удалена!',
@@ -106,9 +127,7 @@ class CustomUserViewSet(UserViewSet, SubscriptionsManagerMixin):
             methods=['GET'],
             permission_classes=[IsAuthenticated])
     def subscriptions(self, request):
-        user = request.user
-        subscriptions = Subscribe.objects.filter(user=user)
-
+        subscriptions = self.get_subscriptions(request)
         paginator = self.pagination_class()
         result_page = paginator.paginate_queryset(subscriptions, request)
 
@@ -116,12 +135,83 @@ class CustomUserViewSet(UserViewSet, SubscriptionsManagerMixin):
                                                context={'request': request})
         return paginator.get_paginated_response(serializer.data)
 
+    def get_subscriptions(self, request):
+        """Подписки с последними рецептами авторов.
+
+        Последние recipes_limit рецептов всех авторов страницы выбираются
+        одним запросом: срез в Prefetch Django превращает в ROW_NUMBER()
+        OVER (PARTITION BY author_id).
+        """
+        recipes = Recipe.objects.order_by('-pub_date')
+        recipes_limit = UserInSubscribeSerializer.get_recipes_limit(request)
+        if recipes_limit is not None:
+            recipes = recipes[:recipes_limit]
+        return (
+            Subscribe.objects.filter(user=request.user)
+            .select_related('author')
+            .prefetch_related(Prefetch('author__recipes', queryset=recipes,
+                                       to_attr='subscription_recipes'))
+        )
+
 
-class RecipeViewSet(ModelViewSet, SubscriptionsManagerMixin):
+class RecipeViewSet(ConditionalGetMixin, ModelViewSet,
+                    SubscriptionsManagerMixin):
     queryset = Recipe.objects.all()
     permission_classes = [IsAuthenticatedOrReadOnly, IsAuthorOrReadOnly, ]
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
+    pagination_class = KeysetPagination
+    parser_classes = (JSONParser, MultiPartParser, FormParser)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'feed':
+            queryset = queryset.filter(author__in=Subscribe.objects.filter(
+                user=self.request.user).values('author'))
+        if self.action in ('list', 'retrieve', 'feed'):
+            queryset = queryset.select_related('author').prefetch_related(
+                Prefetch('tags', queryset=Tag.objects.all()),
+                Prefetch('ingredients',
+                         queryset=AmountIngredient.objects.select_related(
+                             'ingredient')),
+            )
+            queryset = self.annotate_user_flags(queryset)
+        return queryset
+
+    def annotate_user_flags(self, queryset):
+        user = self.request.user
+        if user.is_anonymous:
+            return queryset.annotate(is_favorited=Value(False),
+                                     is_in_shopping_cart=Value(False))
+        return queryset.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(Cart.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+        )
+
+    def get_state(self, queryset):
+        """Состояние - значения полей объектов отдаваемой страницы.
+
+        Учитываются версии, счетчики, отметки пользователя и ключи
+        сортировки, которые меняются без смены версии (популярность, ранг
+        поиска).
+        """
+        fields = ['pk', 'version', 'favorites_count', 'shopping_cart_count',
+                  'author__recipes_count', 'author__followers_count',
+                  'is_favorited', 'is_in_shopping_cart']
+        fields += [field.lstrip('-') for field in (
+            queryset.query.order_by or Recipe._meta.ordering)]
+        user = self.request.user
+        if user.is_authenticated:
+            queryset = queryset.annotate(is_subscribed=Exists(
+                Subscribe.objects.filter(user=user,
+                                         author=OuterRef('author'))))
+            fields.append('is_subscribed')
+        if self.action == 'retrieve' or self.pagination_class is None:
+            return list(queryset.values_list(*fields))
+        return self.pagination_class().get_page_values(
+            queryset, self.request, fields)
 
     def check_item(self, model, id):
         return model.objects.filter(id=id).exists()
@@ -139,6 +229,7 @@ class RecipeViewSet(ModelViewSet, SubscriptionsManagerMixin):
     @action(detail=True,
             methods=['POST'],
             permission_classes=[IsAuthenticated])
+    @transaction.atomic
     def shopping_cart(self, request, *args, **kwargs):
         if not self.check_item(Recipe, kwargs.get('pk')):
             return Response({"Такого рецепта нет!"},
@@ -148,6 +239,7 @@ class RecipeViewSet(ModelViewSet, SubscriptionsManagerMixin):
         return self.add_subscribe(RecipeInCartSerializer(data=data))
 
     @shopping_cart.mapping.delete
+    @transaction.atomic
     def delete_shopping_cart(self, request, *args, **kwargs):
         if not self.check_item(Recipe, kwargs.get('pk')):
             return Response({"Такого рецепта нет!"},
@@ -158,33 +250,41 @@ class RecipeViewSet(ModelViewSet, SubscriptionsManagerMixin):
         return self.delete_subscribe(Cart, filter_set, message)
 
     @action(detail=False,
-            methods=['GET'])
+            methods=['GET'],
+            permission_classes=[IsAuthenticated])
+    def feed(self, request, *args, **kwargs):
+        return self.list(request, *args, **kwargs)
+
+    @action(detail=False,
+            methods=['GET'],
+            permission_classes=[IsAuthenticated],
+            content_negotiation_class=IgnoreClientContentNegotiation)
     def download_shopping_cart(self, request):
-        user = request.user
-        shopping_cart = user.cart.select_related('recipe').all()
-        if not shopping_cart:
+        export_format = request.query_params.get('format', 'txt')
+        if export_format not in EXPORT_FORMATS:
+            return Response(
+                {'format': f'Доступные форматы: {", ".join(EXPORT_FORMATS)}'},
+                status=status.HTTP_400_BAD_REQUEST)
+        shopping_list = request.user.shopping_list.order_by(
+            'ingredient__name'
+        ).values_list(
+            'ingredient__name', 'ingredient__measurement_unit', 'total_amount'
+        )
+        if not shopping_list.exists():
             return Response({"Корзина покупок пуста!"},
                             status=status.HTTP_404_NOT_FOUND)
 
-        ingredients_data = AmountIngredient.objects.filter(
-            recipe__in=[cart_item.recipe for cart_item in shopping_cart]
-        ).values(
-            'ingredient__name', 'ingredient__measurement_unit'
-        ).annotate(
-            total_amount=Sum('amount')
-        ).values_list(
-            'ingredient__name', 'total_amount', 'ingredient__measurement_unit'
-        )
-        ingredients_list = []
-        for name, total_amount, unit in ingredients_data:
-            ingredients_list.append(
-                f" - {name}: {total_amount} {unit}"
-            )
-        return Response(ingredients_list)
+        export, content_type = EXPORT_FORMATS[export_format]
+        response = StreamingHttpResponse(
+            export(shopping_list.iterator()), content_type=content_type)
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_list.{export_format}"')
+        return response
 
     @action(detail=True,
             methods=['POST'],
             permission_classes=[IsAuthenticated])
+    @transaction.atomic
     def favorite(self, request, *args, **kwargs):
         if not self.check_item(Recipe, kwargs.get('pk')):
             return Response({"Такого рецепта нет!"},
@@ -193,6 +293,7 @@ class RecipeViewSet(ModelViewSet, SubscriptionsManagerMixin):
         return self.add_subscribe(RecipeInFavoriteerializer(data=data))
 
     @favorite.mapping.delete
+    @transaction.atomic
     def delete_favorite(self, request, *args, **kwargs):
         if not self.check_item(Recipe, kwargs.get('pk')):
             return Response({"Такого рецепта нет!"},
@@ -202,6 +303,16 @@ class RecipeViewSet(ModelViewSet, SubscriptionsManagerMixin):
                    'error': 'В избранном нет такого рецепта!'}
         return self.delete_subscribe(Favorite, filter_set, message)
 
+    @action(detail=True,
+            methods=['GET'])
+    def similar(self, request, *args, **kwargs):
+        recipe = self.get_object()
+        similar = Recipe.objects.filter(
+            similar_to__recipe=recipe).order_by('-similar_to__score')
+        serializer = ShortRecipeSerializer(similar, many=True,
+                                           context={'request': request})
+        return Response(serializer.data)
+
     @action(detail=True,
             url_path='get-link',
             methods=['GET'])
@@ -209,4 +320,7 @@ class RecipeViewSet(ModelViewSet, SubscriptionsManagerMixin):
         recipe = self.get_object()
         domain = request.get_host()
         short_link = urljoin(f"https://{domain}/s/", str(recipe.short_link))
-        return Response({'short-link': short_link}, status=status.HTTP_200_OK)
+        clicks = recipe.short_link_clicks + short_link_clicks.pending(
+            recipe.id)
+        return Response({'short-link': short_link, 'clicks': clicks},
+                        status=status.HTTP_200_OK)
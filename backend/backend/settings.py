@@ -75,10 +75,26 @@ DATABASES_SQLITE = {
         'NAME': BASE_DIR / 'db.sqlite3',
     }
 }
+# Кэш общий для всех процессов: в нем журналы изменений индексов в памяти.
+CACHES_REDIS = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('REDIS_URL') or 'redis://redis:6379/0',
+    }
+}
+
+CACHES_LOCMEM = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
 if os.getenv('TEST_DB', 'True').lower() != 'true':
     DATABASES = DATABASES_POSTGRESQL
+    CACHES = CACHES_REDIS
 else:
     DATABASES = DATABASES_SQLITE
+    CACHES = CACHES_LOCMEM
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -106,9 +122,21 @@ USE_TZ = True
 STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'backend_static'
 
+# Загруженные файлы больше порога пишутся во временный файл на диске.
+FILE_UPLOAD_MAX_MEMORY_SIZE = 512 * 1024
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+STORAGES = {
+    'default': {
+        'BACKEND': 'recipes.storage.ContentAddressedStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'users.User'
@@ -127,6 +155,44 @@ REST_FRAMEWORK = {
 
 }
 
+RECIPE_CACHE_TIMEOUT = int(os.getenv('RECIPE_CACHE_TIMEOUT', 60 * 60))
+
+INGREDIENT_SEARCH_LIMIT = 20
+
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
+
+SHORT_LINK_SALT = int(os.getenv('SHORT_LINK_SALT', 0))
+SHORT_LINK_CACHE_SIZE = 10000
+SHORT_LINK_NEGATIVE_TTL = 60
+SHORT_LINK_CLICKS_FLUSH_INTERVAL = 30
+SHORT_LINK_CLICKS_FLUSH_SIZE = 500
+
+POPULARITY_WEIGHTS = {
+    'favorite': 2.0,
+    'cart': 1.0,
+}
+POPULARITY_HALF_LIFE_HOURS = 7 * 24
+
+SIMILAR_RECIPES_LIMIT = 10
+
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+IMAGE_MAX_PIXELS = 40_000_000
+IMAGE_QUALITY = 85
+AVATAR_MAX_UPLOAD_SIZE = 2 * 1024 * 1024
+RECIPE_IMAGE_MAX_UPLOAD_SIZE = 8 * 1024 * 1024
+AVATAR_SIZE = 256
+AVATAR_FORMAT = 'WEBP'
+# Суффикс имени: (размер, обрезать до квадрата).
+RECIPE_THUMBNAILS = {
+    'small': (200, True),
+    'medium': (600, False),
+}
+RECIPE_THUMBNAIL_FORMAT = 'WEBP'
+
+PANTRY_MIN_COVERAGE = 0.5
+PANTRY_SEARCH_LIMIT = 500
+
 DJOSER = {
     'SERIALIZERS': {
         'user_create': 'api.serializers.CustomUserCreateSerializer',
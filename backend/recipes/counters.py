@@ -0,0 +1,49 @@
+"""Счетчики, хранимые в столбцах рецептов и пользователей.
+
+Счетчики меняются обновлением через F() в сигналах создания и удаления
+считаемых объектов, а расхождения исправляет reconcile_counters.
+"""
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from users.models import Subscribe
+
+from .models import Cart, Favorite, Recipe
+
+User = get_user_model()
+
+# Модель со счетчиком, столбец счетчика, считаемая модель и ее ссылка.
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'shopping_cart_count', Cart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Subscribe, 'author'),
+)
+
+
+def change_counter(model, pk, field, delta, **extra):
+    queryset = model.objects.filter(pk=pk)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta}, **extra)
+
+
+def actual_count(counted_model, link):
+    return Coalesce(Subquery(
+        counted_model.objects.filter(**{link: OuterRef('pk')})
+        .order_by().values(link).annotate(count=Count('pk')).values('count')
+    ), Value(0))
+
+
+def reconcile_counters():
+    """Пересчитывает счетчики, возвращает число исправленных строк."""
+    fixed = {}
+    for model, field, counted_model, link in COUNTERS:
+        actual = actual_count(counted_model, link)
+        fixed[f'{model._meta.label}.{field}'] = (
+            model.objects.annotate(actual=actual)
+            .exclude(**{field: F('actual')})
+            .update(**{field: actual})
+        )
+    return fixed
@@ -0,0 +1,55 @@
+"""Учет ссылок из полей моделей на файлы в хранилище.
+
+Одинаковые загрузки хранятся одним файлом, поэтому файл удаляется,
+только когда на него не остается ссылок.
+"""
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+
+from .models import Recipe, StoredFile
+
+User = get_user_model()
+
+FILE_FIELDS = {
+    Recipe: ('image', 'image_small', 'image_medium'),
+    User: ('avatar',),
+}
+
+
+def file_names(instance, fields):
+    names = {getattr(instance, field).name for field in fields}
+    return names - {'', None}
+
+
+def acquire(names):
+    names = set(names) - {'', None}
+    if not names:
+        return
+    StoredFile.objects.bulk_create(
+        (StoredFile(name=name) for name in names), ignore_conflicts=True)
+    StoredFile.objects.filter(name__in=names).update(
+        references=F('references') + 1)
+
+
+def release(names):
+    """Снимает ссылки и удаляет файлы без ссылок после фиксации."""
+    names = set(names) - {'', None}
+    if not names:
+        return
+    StoredFile.objects.filter(name__in=names, references__gt=0).update(
+        references=F('references') - 1)
+
+    def delete_unused():
+        for name in list(StoredFile.objects.filter(
+                name__in=names, references=0).values_list('name', flat=True)):
+            # Блокировка строки не дает хранилищу взять этот файл для
+            # новой загрузки, пока он удаляется (см. storage.claim).
+            with transaction.atomic():
+                if StoredFile.objects.select_for_update().filter(
+                        name=name, references=0).exists():
+                    default_storage.delete(name)
+                    StoredFile.objects.filter(name=name).delete()
+
+    transaction.on_commit(delete_unused)
@@ -0,0 +1,158 @@
+"""Поиск ингредиентов по названию в памяти процесса.
+
+Индекс - отсортированный список названий в casefold, по которому
+бинарным поиском находятся совпадения по началу строки, и инвертированный
+индекс триграмм для поиска по подстроке и с опечатками. Индекс строится
+лениво и перестраивается, когда в кэше меняется поколение ингредиентов;
+поколение проверяется не чаще раза в GENERATION_CHECK_INTERVAL секунд.
+"""
+import bisect
+import re
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+
+from django.core.cache import cache
+
+from .models import Ingredient
+
+GENERATION_KEY = 'ingredient-index-generation'
+SIMILARITY_THRESHOLD = 0.3
+FUZZY_TIME_BUDGET = 0.002
+SUBSTRING_TIME_BUDGET = 0.002
+GENERATION_CHECK_INTERVAL = 1
+
+
+def trigrams(text):
+    """Триграммы слов строки, дополненных пробелами, как в pg_trgm."""
+    result = set()
+    for word in re.findall(r'\w+', text):
+        padded = f'  {word} '
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+class IngredientIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._generation = None
+        self._checked_at = None
+        self._keys = []
+        self._rows = []
+        self._trigram_counts = []
+        self._postings = {}
+
+    def invalidate(self):
+        cache.set(GENERATION_KEY, uuid.uuid4().hex, None)
+        self._checked_at = None
+
+    def _refresh(self):
+        now = time.monotonic()
+        if (self._checked_at is not None
+                and now - self._checked_at < GENERATION_CHECK_INTERVAL):
+            return
+        self._checked_at = now
+        generation = cache.get_or_set(GENERATION_KEY, uuid.uuid4().hex, None)
+        if generation == self._generation:
+            return
+        with self._lock:
+            if generation == self._generation:
+                return
+            entries = sorted(
+                (name.casefold(), id, name, measurement_unit)
+                for id, name, measurement_unit in Ingredient.objects
+                .values_list('id', 'name', 'measurement_unit'))
+            keys = [key for key, *_ in entries]
+            rows = [{'id': id, 'name': name, 'measurement_unit': unit}
+                    for _, id, name, unit in entries]
+            trigram_counts = []
+            postings = defaultdict(list)
+            for index, key in enumerate(keys):
+                key_trigrams = trigrams(key)
+                trigram_counts.append(len(key_trigrams))
+                for trigram in key_trigrams:
+                    postings[trigram].append(index)
+            (self._keys, self._rows, self._trigram_counts,
+             self._postings) = keys, rows, trigram_counts, dict(postings)
+            self._generation = generation
+
+    def search(self, query, limit):
+        """Возвращает до limit ингредиентов, подходящих под запрос.
+
+        Сначала идут названия, начинающиеся с запроса, затем названия,
+        содержащие его, ближе к началу - раньше, затем похожие по
+        триграммам в порядке убывания сходства.
+        """
+        self._refresh()
+        keys = self._keys
+        query = query.casefold()
+
+        start = bisect.bisect_left(keys, query)
+        end = start
+        while end < len(keys) and end - start < limit:
+            if not keys[end].startswith(query):
+                break
+            end += 1
+        found = list(range(start, end))
+        if len(found) < limit:
+            found += self._containing(query, limit - len(found))
+        if len(found) < limit:
+            found += self._similar(query, set(found), limit - len(found))
+        return [self._rows[index] for index in found]
+
+    def _containing(self, query, limit):
+        """Названия, содержащие запрос не с начала, по позиции вхождения.
+
+        Кандидаты берутся из пересечения списков триграмм запроса; для
+        коротких запросов без триграмм названия перебираются в пределах
+        бюджета времени.
+        """
+        keys = self._keys
+        query_trigrams = {query[i:i + 3] for i in range(len(query) - 2)
+                          if re.fullmatch(r'\w{3}', query[i:i + 3])}
+        if query_trigrams:
+            postings = sorted((self._postings.get(trigram, ())
+                               for trigram in query_trigrams), key=len)
+            candidates = set(postings[0]).intersection(*postings[1:])
+        else:
+            candidates = range(len(keys))
+        deadline = time.perf_counter() + SUBSTRING_TIME_BUDGET
+        matches = []
+        for index in candidates:
+            position = keys[index].find(query)
+            if position > 0:
+                matches.append((position, index))
+            if not query_trigrams and time.perf_counter() > deadline:
+                break
+        matches.sort()
+        return [index for _, index in matches[:limit]]
+
+    def _similar(self, query, exclude, limit):
+        """Названия, похожие на запрос, с учетом бюджета времени.
+
+        Списки триграмм обходятся от редких к частым; при исчерпании
+        бюджета сходство считается по уже просмотренным триграммам.
+        """
+        query_trigrams = trigrams(query)
+        if not query_trigrams:
+            return []
+        deadline = time.perf_counter() + FUZZY_TIME_BUDGET
+        postings = sorted((self._postings.get(trigram, ())
+                           for trigram in query_trigrams), key=len)
+        shared = Counter()
+        for posting in postings:
+            shared.update(posting)
+            if time.perf_counter() > deadline:
+                break
+        scored = []
+        for index, count in shared.items():
+            similarity = count / (len(query_trigrams)
+                                  + self._trigram_counts[index] - count)
+            if similarity >= SIMILARITY_THRESHOLD and index not in exclude:
+                scored.append((-similarity, index))
+        scored.sort()
+        return [index for _, index in scored[:limit]]
+
+
+ingredient_index = IngredientIndex()
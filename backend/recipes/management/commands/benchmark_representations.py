@@ -0,0 +1,59 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Prefetch
+from rest_framework.request import Request
+from rest_framework.serializers import ModelSerializer
+from rest_framework.test import APIRequestFactory
+
+from api.representations import recipe_public_data
+from api.serializers import RecipeSerializer
+from recipes.models import AmountIngredient, Recipe
+
+from .generate_recipes import generate_recipes
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает скорость представления рецептов через DRF и '
+            'без него; данные создаются во временной транзакции')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.benchmark(options['recipes'], options['repeat'])
+            transaction.set_rollback(True)
+
+    def benchmark(self, count, repeat):
+        recipe_ids = generate_recipes(count)
+        recipes = list(
+            Recipe.objects.filter(pk__in=recipe_ids)
+            .select_related('author').prefetch_related(
+                'tags', Prefetch('ingredients',
+                                 AmountIngredient.objects.select_related(
+                                     'ingredient'))))
+        request = Request(APIRequestFactory().get(
+            '/api/recipes/', HTTP_HOST=settings.ALLOWED_HOSTS[0]))
+        serializer = RecipeSerializer(context={'request': request})
+
+        def drf():
+            for recipe in recipes:
+                ModelSerializer.to_representation(serializer, recipe)
+
+        def fast():
+            for recipe in recipes:
+                recipe_public_data(recipe, request)
+
+        for name, function in (('DRF', drf), ('representations', fast)):
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                function()
+                timings.append(time.perf_counter() - start)
+            self.stdout.write(self.style.SUCCESS(
+                f'{name}: {min(timings) * 1000:.1f} мс '
+                f'на {len(recipes)} рецептов'))
@@ -0,0 +1,56 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.http import QueryDict
+
+from api.filters import RecipeFilter
+from recipes.models import Recipe, Tag
+
+PAGE_SIZE = 6
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает фильтр рецептов по тегам через JOIN с DISTINCT и '
+            'через EXISTS; данные создаются командой generate_recipes')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tags', nargs='+',
+                            help='Слаги тегов, по умолчанию два первых')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        slugs = options['tags'] or list(
+            Tag.objects.order_by('id').values_list('slug', flat=True)[:2])
+        if not slugs:
+            raise CommandError('Нет тегов: запустите generate_recipes.')
+
+        def join():
+            # Так работал AllValuesMultipleFilter: выбор слагов и DISTINCT.
+            list(Recipe.objects.distinct().order_by('tags__slug')
+                 .values_list('tags__slug', flat=True))
+            condition = Q()
+            for slug in slugs:
+                condition |= Q(tags__slug=slug)
+            queryset = Recipe.objects.filter(condition).distinct()
+            return list(queryset[:PAGE_SIZE]), queryset.count()
+
+        data = QueryDict(mutable=True)
+        data.setlist('tags', slugs)
+
+        def exists():
+            queryset = RecipeFilter(data, Recipe.objects.all()).qs
+            return list(queryset[:PAGE_SIZE]), queryset.count()
+
+        exists()
+        self.stdout.write(f'Рецептов: {Recipe.objects.count()}, '
+                          f'теги: {", ".join(slugs)}')
+        for name, function in (('JOIN + DISTINCT', join),
+                               ('EXISTS', exists)):
+            timings = []
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                _, count = function()
+                timings.append(time.perf_counter() - start)
+            self.stdout.write(self.style.SUCCESS(
+                f'{name}: {min(timings) * 1000:.0f} мс, найдено {count}'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Уменьшает популярность рецептов со временем'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours', type=float, default=24,
+            help='Время с прошлого запуска, по умолчанию сутки')
+
+    def handle(self, *args, **options):
+        updated = Recipe.objects.decay_popularity(options['hours'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Популярность уменьшена у {updated} рецептов'))
@@ -0,0 +1,79 @@
+import random
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import AmountIngredient, Ingredient, Recipe, Tag
+from recipes.short_links import encode_short_link
+
+User = get_user_model()
+
+AUTHOR_USERNAME = 'benchmark'
+TAGS_COUNT = 10
+INGREDIENTS_COUNT = 2000
+
+
+def generate_recipes(count, tags_per_recipe=2, ingredients_per_recipe=3,
+                     batch_size=5000, seed=0):
+    """Создает count рецептов со случайными тегами и ингредиентами.
+
+    Недостающие теги и ингредиенты создаются. Возвращает id рецептов.
+    """
+    rng = random.Random(seed)
+    author, _ = User.objects.get_or_create(
+        username=AUTHOR_USERNAME,
+        defaults={'email': f'{AUTHOR_USERNAME}@example.com',
+                  'first_name': 'Тест', 'last_name': 'Тестов'})
+    Tag.objects.bulk_create(
+        (Tag(name=f'Тег {number}', slug=f'tag-{number}')
+         for number in range(TAGS_COUNT)), ignore_conflicts=True)
+    Ingredient.objects.bulk_create(
+        (Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+         for number in range(INGREDIENTS_COUNT)), ignore_conflicts=True)
+    tag_ids = list(Tag.objects.values_list('id', flat=True))
+    ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+    start = author.recipes.count()
+
+    recipe_ids = []
+    for offset in range(0, count, batch_size):
+        with transaction.atomic():
+            recipes = Recipe.objects.bulk_create(
+                Recipe(author=author, name=f'Рецепт {start + number}',
+                       text='Описание рецепта',
+                       cooking_time=rng.randint(1, 200),
+                       image='recipe_images/benchmark.png')
+                for number in range(offset, min(offset + batch_size, count)))
+            for recipe in recipes:
+                recipe.short_link = encode_short_link(recipe.pk)
+            Recipe.objects.bulk_update(recipes, ('short_link',))
+            Recipe.tags.through.objects.bulk_create(
+                Recipe.tags.through(recipe_id=recipe.pk, tag_id=tag_id)
+                for recipe in recipes
+                for tag_id in rng.sample(tag_ids, tags_per_recipe))
+            AmountIngredient.objects.bulk_create(
+                AmountIngredient(recipe_id=recipe.pk, ingredient_id=id,
+                                 amount=rng.randint(1, 500))
+                for recipe in recipes
+                for id in rng.sample(ingredient_ids, ingredients_per_recipe))
+        recipe_ids.extend(recipe.pk for recipe in recipes)
+    User.objects.filter(pk=author.pk).update(
+        recipes_count=author.recipes.count())
+    return recipe_ids
+
+
+class Command(BaseCommand):
+    help = 'Создает рецепты для замеров производительности'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument('--tags-per-recipe', type=int, default=2)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        recipe_ids = generate_recipes(
+            options['recipes'], options['tags_per_recipe'],
+            options['ingredients_per_recipe'], seed=options['seed'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано рецептов: {len(recipe_ids)}'))
@@ -0,0 +1,48 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Q
+from PIL import UnidentifiedImageError
+
+from api.images import apply_thumbnails, write_thumbnails
+from recipes.models import Recipe
+
+CHUNK_SIZE = 16
+
+
+def make_thumbnails(name):
+    try:
+        return write_thumbnails(name)
+    except (OSError, UnidentifiedImageError):
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Создает недостающие миниатюры изображений рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+
+    def handle(self, *args, **options):
+        images = list(Recipe.objects.exclude(image='').filter(
+            Q(image_small='') | Q(image_medium='')
+        ).values_list('id', 'image'))
+        # Дочерние процессы не должны наследовать соединения с базой.
+        connections.close_all()
+        created, failed = 0, []
+        with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+            names = executor.map(make_thumbnails,
+                                 [name for _, name in images],
+                                 chunksize=CHUNK_SIZE)
+            for (recipe_id, name), thumbnails in zip(images, names):
+                if thumbnails is None:
+                    failed.append(name)
+                    continue
+                apply_thumbnails(recipe_id, name, thumbnails)
+                created += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Миниатюры созданы для {created} рецептов'))
+        for name in failed:
+            self.stderr.write(f'Не удалось обработать {name}')
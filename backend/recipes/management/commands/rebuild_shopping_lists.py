@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает или проверяет итоги списков покупок'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только сравнить итоги с корзинами, ничего не меняя')
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            ShoppingListItem.objects.rebuild()
+            self.stdout.write(self.style.SUCCESS(
+                'Списки покупок перестроены, позиций: '
+                f'{ShoppingListItem.objects.count()}'))
+            return
+
+        expected = ShoppingListItem.objects.expected_totals()
+        actual = {
+            (user_id, ingredient_id): total_amount
+            for user_id, ingredient_id, total_amount in
+            ShoppingListItem.objects.values_list(
+                'user_id', 'ingredient_id', 'total_amount')
+        }
+        mismatched = {key for key in expected.keys() | actual.keys()
+                      if expected.get(key) != actual.get(key)}
+        if mismatched:
+            raise CommandError(
+                f'Расхождения в списках покупок: {len(mismatched)}')
+        self.stdout.write(self.style.SUCCESS(
+            'Списки покупок совпадают с корзинами'))
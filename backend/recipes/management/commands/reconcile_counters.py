@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from recipes.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счетчики рецептов и пользователей'
+
+    def handle(self, *args, **options):
+        for counter, fixed in reconcile_counters().items():
+            self.stdout.write(self.style.SUCCESS(
+                f'{counter}: исправлено строк {fixed}'))
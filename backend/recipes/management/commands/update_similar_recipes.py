@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipes.similarity import BATCH_SIZE, update_similar_recipes
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает похожие рецепты по общим ингредиентам'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--new', action='store_true',
+            help='Только новые рецепты и их соседи')
+        parser.add_argument(
+            '--limit', type=int, default=settings.SIMILAR_RECIPES_LIMIT,
+            help='Сколько похожих рецептов хранить для каждого')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        updated = update_similar_recipes(options['limit'], options['new'],
+                                         options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Похожие рецепты пересчитаны для {updated} рецептов'))
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.13 on 2026-10-18 04:02
+
+from django.db import migrations
+
+
+def install_search_index(apps, schema_editor):
+    from recipes.search import install_search_index
+    install_search_index(schema_editor.connection)
+
+
+def uninstall_search_index(apps, schema_editor):
+    from recipes.search import uninstall_search_index
+    uninstall_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0021_recipe_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.13 on 2026-10-18 03:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0022_recipe_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='short_link_clicks',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Переходы по короткой ссылке'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.13 on 2026-10-18 03:45
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+COUNTERS = (
+    ('recipes.Recipe', 'favorites_count', 'recipes.Favorite', 'recipe'),
+    ('recipes.Recipe', 'shopping_cart_count', 'recipes.Cart', 'recipe'),
+    ('users.User', 'recipes_count', 'recipes.Recipe', 'author'),
+    ('users.User', 'followers_count', 'users.Subscribe', 'author'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for model_label, field, counted_label, link in COUNTERS:
+        model = apps.get_model(model_label)
+        counted_model = apps.get_model(counted_label)
+        model.objects.update(**{field: Coalesce(Subquery(
+            counted_model.objects.filter(**{link: OuterRef('pk')})
+            .order_by().values(link).annotate(count=Count('pk'))
+            .values('count')
+        ), Value(0))})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0025_recipe_author_pub_date_idx'),
+        ('users', '0003_user_followers_count_user_recipes_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='shopping_cart_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В корзинах'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
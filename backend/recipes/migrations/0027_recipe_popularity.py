@@ -0,0 +1,30 @@
+# Generated by Django 4.2.13 on 2026-10-18 03:49
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_popularity(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Recipe.objects.update(popularity=(2.0 * F('favorites_count')
+                                      + 1.0 * F('shopping_cart_count')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0026_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='popularity',
+            field=models.FloatField(default=0, editable=False, verbose_name='Популярность'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-popularity', '-pub_date', '-id'], name='recipe_popularity_idx'),
+        ),
+        migrations.RunPython(fill_popularity, migrations.RunPython.noop),
+    ]
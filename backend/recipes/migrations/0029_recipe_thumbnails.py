@@ -0,0 +1,23 @@
+# Generated by Django 4.2.13 on 2026-10-18 03:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0028_similarrecipe'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_medium',
+            field=models.ImageField(blank=True, editable=False, upload_to='recipe_images/', verbose_name='Уменьшенное изображение'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='image_small',
+            field=models.ImageField(blank=True, editable=False, upload_to='recipe_images/', verbose_name='Миниатюра'),
+        ),
+    ]
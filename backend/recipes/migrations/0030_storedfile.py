@@ -0,0 +1,47 @@
+# Generated by Django 4.2.13 on 2026-10-18 04:03
+
+from collections import Counter
+
+from django.db import migrations, models
+
+FILE_FIELDS = (
+    ('recipes.Recipe', ('image', 'image_small', 'image_medium')),
+    ('users.User', ('avatar',)),
+)
+
+
+def count_references(apps, schema_editor):
+    StoredFile = apps.get_model('recipes', 'StoredFile')
+    references = Counter()
+    for model_label, fields in FILE_FIELDS:
+        model = apps.get_model(model_label)
+        for names in model.objects.values_list(*fields).iterator():
+            references.update(name for name in names if name)
+    StoredFile.objects.bulk_create(
+        (StoredFile(name=name, references=count)
+         for name, count in references.items()),
+        batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0029_recipe_thumbnails'),
+        ('users', '0003_user_followers_count_user_recipes_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Имя файла')),
+                ('references', models.PositiveIntegerField(default=0, verbose_name='Число ссылок')),
+            ],
+            options={
+                'verbose_name': 'Файл',
+                'verbose_name_plural': 'Файлы',
+            },
+        ),
+        migrations.RunPython(count_references, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.13 on 2026-10-18 04:30
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0030_storedfile'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='recipe',
+            name='updated_at',
+        ),
+    ]
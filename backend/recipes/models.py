@@ -1,8 +1,10 @@
-import hashlib
+from collections import Counter
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Sum
 
 User = get_user_model()
 
@@ -54,6 +56,25 @@ class Tag(models.Model):
         return self.name
 
 
+def popularity_decay(hours):
+    """Доля веса в популярности, остающаяся через hours часов."""
+    return 0.5 ** (hours / settings.POPULARITY_HALF_LIFE_HOURS)
+
+
+class RecipeQuerySet(models.QuerySet):
+    def decay_popularity(self, hours):
+        """Уменьшает популярность по периоду полураспада за hours часов."""
+        return self.filter(popularity__gt=0).update(
+            popularity=models.F('popularity') * popularity_decay(hours))
+
+    def touch(self, **fields):
+        """Увеличивает версию рецептов, сбрасывая их кэшированные копии.
+
+        Вместе с версией можно обновить и другие поля.
+        """
+        return self.update(version=models.F('version') + 1, **fields)
+
+
 class Recipe(models.Model):
     name = models.CharField(
         verbose_name="Название блюда",
@@ -86,6 +107,18 @@ class Recipe(models.Model):
         verbose_name="Изображение блюда",
         upload_to="recipe_images/",
     )
+    image_small = models.ImageField(
+        verbose_name="Миниатюра",
+        upload_to="recipe_images/",
+        blank=True,
+        editable=False,
+    )
+    image_medium = models.ImageField(
+        verbose_name="Уменьшенное изображение",
+        upload_to="recipe_images/",
+        blank=True,
+        editable=False,
+    )
     text = models.TextField(
         verbose_name="Описание блюда",
     )
@@ -108,6 +141,33 @@ class Recipe(models.Model):
         blank=True,
         null=True
     )
+    short_link_clicks = models.PositiveIntegerField(
+        verbose_name="Переходы по короткой ссылке",
+        default=0,
+        editable=False,
+    )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name="В избранном",
+        default=0,
+        editable=False,
+    )
+    shopping_cart_count = models.PositiveIntegerField(
+        verbose_name="В корзинах",
+        default=0,
+        editable=False,
+    )
+    popularity = models.FloatField(
+        verbose_name="Популярность",
+        default=0,
+        editable=False,
+    )
+    version = models.PositiveIntegerField(
+        verbose_name="Версия",
+        default=1,
+        editable=False,
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Рецепт"
@@ -119,16 +179,36 @@ class Recipe(models.Model):
                 name="unique_for_author",
             ),
         ]
-
-    def generate_unique_short_link(self):
-        while True:
-            short_link = hashlib.md5(str(self.name).encode()).hexdigest()[:6]
-            if not Recipe.objects.filter(short_link=short_link).exists():
-                return short_link
+        indexes = [
+            models.Index(
+                fields=("author", "-pub_date"),
+                name="recipe_author_pub_date_idx",
+            ),
+            models.Index(
+                fields=("-popularity", "-pub_date", "-id"),
+                name="recipe_popularity_idx",
+            ),
+        ]
 
     def save(self, *args, **kwargs):
-        self.short_link = self.generate_unique_short_link()
+        adding = self._state.adding
+        if not adding:
+            # Версия увеличивается в базе: после touch() экземпляр может
+            # хранить уже использованный номер.
+            self.version = models.F('version') + 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'],
+                                           'version'}
         super().save(*args, **kwargs)
+        if not adding:
+            self.refresh_from_db(fields=('version',))
+        if not self.short_link:
+            from .short_links import encode_short_link, short_link_resolver
+            self.short_link = encode_short_link(self.pk)
+            Recipe.objects.filter(pk=self.pk).update(
+                short_link=self.short_link)
+            # Код мог попасть в кэш как ненайденный до создания рецепта.
+            short_link_resolver.discard(self.short_link)
 
     def __str__(self):
         return f"{self.name}. Автор: {self.author.username}"
@@ -178,6 +258,10 @@ class Favorite(models.Model):
         related_name='favorites',
         verbose_name='Рецепт',
     )
+    added_at = models.DateTimeField(
+        verbose_name='Дата добавления',
+        auto_now_add=True,
+    )
 
     class Meta:
         ordering = ['-id']
@@ -203,6 +287,10 @@ class Cart(models.Model):
         related_name='cart',
         verbose_name='Рецепт',
     )
+    added_at = models.DateTimeField(
+        verbose_name='Дата добавления',
+        auto_now_add=True,
+    )
 
     class Meta:
         ordering = ['-id']
@@ -213,3 +301,160 @@ class Cart(models.Model):
                 fields=['user', 'recipe'],
                 name='unique cart user')
         ]
+
+
+class ShoppingListQuerySet(models.QuerySet):
+    def apply(self, amounts):
+        """Прибавляет к итогам изменения {(user_id, ingredient_id): delta}.
+
+        Строки с нулевым итогом удаляются.
+        """
+        amounts = {key: delta for key, delta in amounts.items() if delta}
+        if not amounts:
+            return
+        with transaction.atomic():
+            existing = {
+                (item.user_id, item.ingredient_id): item
+                for item in self.select_for_update().filter(
+                    user_id__in={user_id for user_id, _ in amounts},
+                    ingredient_id__in={ingredient_id
+                                       for _, ingredient_id in amounts})
+            }
+            created, updated, deleted = [], [], []
+            for (user_id, ingredient_id), delta in amounts.items():
+                item = existing.get((user_id, ingredient_id))
+                if item is None:
+                    if delta > 0:
+                        created.append(self.model(
+                            user_id=user_id, ingredient_id=ingredient_id,
+                            total_amount=delta))
+                    continue
+                item.total_amount += delta
+                if item.total_amount > 0:
+                    updated.append(item)
+                else:
+                    deleted.append(item.pk)
+            self.bulk_create(created)
+            self.bulk_update(updated, ('total_amount',))
+            self.filter(pk__in=deleted).delete()
+
+    def apply_recipe(self, recipe_id, sign, user_ids=None):
+        """Добавляет (sign=1) или вычитает (sign=-1) ингредиенты рецепта.
+
+        По умолчанию изменяются списки всех, у кого рецепт в корзине.
+        """
+        if user_ids is None:
+            user_ids = Cart.objects.filter(
+                recipe_id=recipe_id).values_list('user_id', flat=True)
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        ingredients = AmountIngredient.objects.filter(
+            recipe_id=recipe_id).values_list('ingredient_id', 'amount')
+        self.apply({
+            (user_id, ingredient_id): sign * amount
+            for ingredient_id, amount in ingredients
+            for user_id in user_ids
+        })
+
+    def expected_totals(self, user_ids=None):
+        """Итоги, посчитанные заново по корзинам."""
+        amounts = AmountIngredient.objects.filter(recipe__cart__isnull=False)
+        if user_ids is not None:
+            amounts = amounts.filter(recipe__cart__user_id__in=user_ids)
+        return Counter({
+            (user_id, ingredient_id): total_amount
+            for user_id, ingredient_id, total_amount in amounts.values(
+                'recipe__cart__user', 'ingredient'
+            ).annotate(
+                total_amount=Sum('amount')
+            ).values_list(
+                'recipe__cart__user', 'ingredient', 'total_amount'
+            ).order_by()
+        })
+
+    def rebuild(self):
+        with transaction.atomic():
+            self.all().delete()
+            self.bulk_create(
+                (self.model(user_id=user_id, ingredient_id=ingredient_id,
+                            total_amount=total_amount)
+                 for (user_id, ingredient_id), total_amount
+                 in self.expected_totals().items()),
+                batch_size=1000)
+
+
+class ShoppingListItem(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент',
+    )
+    total_amount = models.PositiveIntegerField(
+        verbose_name='Общее количество',
+    )
+
+    objects = ShoppingListQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Список покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique shopping list ingredient')
+        ]
+
+
+class SimilarRecipe(models.Model):
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_recipes',
+        verbose_name='Рецепт',
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_to',
+        verbose_name='Похожий рецепт',
+    )
+    score = models.FloatField(
+        verbose_name='Сходство',
+    )
+
+    class Meta:
+        ordering = ['-score']
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'similar'],
+                name='unique similar recipe')
+        ]
+
+
+class StoredFile(models.Model):
+    name = models.CharField(
+        verbose_name='Имя файла',
+        max_length=255,
+        unique=True,
+    )
+    references = models.PositiveIntegerField(
+        verbose_name='Число ссылок',
+        default=0,
+    )
+
+    class Meta:
+        verbose_name = 'Файл'
+        verbose_name_plural = 'Файлы'
+
+    def __str__(self):
+        return self.name
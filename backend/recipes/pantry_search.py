@@ -0,0 +1,173 @@
+"""Поиск рецептов по имеющимся ингредиентам в памяти процесса.
+
+Основа индекса - списки рецептов по ингредиентам в массивах numpy,
+построенные из AmountIngredient. Изменения рецептов пишутся в журнал в
+кэше; каждый процесс дочитывает журнал и держит измененные рецепты
+отдельно, пока их не станет OVERLAY_LIMIT, после чего перестраивает
+основу.
+
+Счетчик журнала может пропасть из кэша и начаться заново, поэтому рядом
+хранится поколение журнала: оно меняется при каждом новом счетчике, и
+процессы с другим поколением перестраивают индекс целиком.
+"""
+import copy
+import threading
+import uuid
+
+import numpy as np
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import AmountIngredient
+
+GENERATION_KEY = 'pantry-index-generation'
+SEQUENCE_KEY = 'pantry-index-sequence'
+CHANGE_KEY = 'pantry-index-change'
+CHANGE_TIMEOUT = 24 * 60 * 60
+OVERLAY_LIMIT = 10000
+FETCH_SIZE = 10000
+
+
+def log_recipe_change(recipe_id):
+    """Записывает изменение ингредиентов рецепта после фиксации."""
+    def log():
+        if cache.add(SEQUENCE_KEY, 0, None):
+            cache.set(GENERATION_KEY, uuid.uuid4().hex, None)
+        sequence = cache.incr(SEQUENCE_KEY)
+        generation = cache.get(GENERATION_KEY)
+        cache.set(f'{CHANGE_KEY}:{generation}:{sequence}', recipe_id,
+                  CHANGE_TIMEOUT)
+    transaction.on_commit(log)
+
+
+def get_log_position():
+    """Поколение журнала и номер последнего изменения в нем."""
+    position = cache.get_many((GENERATION_KEY, SEQUENCE_KEY))
+    generation = position.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, uuid.uuid4().hex, None)
+        generation = cache.get(GENERATION_KEY)
+    return generation, position.get(SEQUENCE_KEY, 0)
+
+
+def load_pairs(queryset):
+    return np.fromiter(
+        (value for pair in queryset.order_by()
+         .values_list('recipe_id', 'ingredient_id')
+         .iterator(chunk_size=FETCH_SIZE) for value in pair),
+        dtype=np.int64).reshape(-1, 2)
+
+
+def find(sorted_values, values):
+    """Позиции значений values, найденных в отсортированном массиве."""
+    values = np.asarray(values, dtype=np.int64)
+    positions = np.searchsorted(sorted_values, values)
+    found = positions < len(sorted_values)
+    found[found] = sorted_values[positions[found]] == values[found]
+    return positions[found]
+
+
+class PantrySnapshot:
+    """Основа индекса и рецепты, измененные после ее построения."""
+
+    def __init__(self, pairs):
+        self.recipe_ids, rows = np.unique(pairs[:, 0], return_inverse=True)
+        self.ingredient_ids, columns = np.unique(pairs[:, 1],
+                                                 return_inverse=True)
+        self.sizes = np.bincount(rows, minlength=len(self.recipe_ids))
+        self.indptr = np.zeros(len(self.ingredient_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(columns, minlength=len(self.ingredient_ids)),
+                  out=self.indptr[1:])
+        self.rows = rows[np.lexsort((rows, columns))]
+        self.stale = np.zeros(len(self.recipe_ids), dtype=bool)
+        self.overlay = {}
+
+    def replace(self, pairs, recipe_ids):
+        """Копия снимка с ингредиентами рецептов из pairs."""
+        snapshot = copy.copy(self)
+        snapshot.overlay = dict(self.overlay)
+        snapshot.overlay.update(
+            (recipe_id, frozenset()) for recipe_id in recipe_ids)
+        for recipe_id, ingredient_id in pairs.tolist():
+            snapshot.overlay[recipe_id] |= {ingredient_id}
+        snapshot.stale = self.stale.copy()
+        snapshot.stale[find(self.recipe_ids, sorted(recipe_ids))] = True
+        return snapshot
+
+    def count(self, have):
+        """id рецептов с имеющимися ингредиентами, их число и всего."""
+        candidates = [self.rows[self.indptr[position]:
+                                self.indptr[position + 1]]
+                      for position in find(self.ingredient_ids, have)]
+        counts = np.bincount(
+            np.concatenate(candidates or [np.empty(0, dtype=np.int64)]),
+            minlength=len(self.recipe_ids))
+        counts[self.stale] = 0
+        rows = np.flatnonzero(counts)
+        recipe_ids, matched, sizes = (
+            [self.recipe_ids[rows]], [counts[rows]], [self.sizes[rows]])
+
+        have = set(have.tolist())
+        for recipe_id, ingredients in self.overlay.items():
+            if have & ingredients:
+                recipe_ids.append([recipe_id])
+                matched.append([len(have & ingredients)])
+                sizes.append([len(ingredients)])
+        return map(np.concatenate, (recipe_ids, matched, sizes))
+
+
+class PantryIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._generation = None
+        self._sequence = None
+        self._snapshot = None
+
+    def _build(self, generation, sequence):
+        self._snapshot = PantrySnapshot(
+            load_pairs(AmountIngredient.objects.all()))
+        self._generation, self._sequence = generation, sequence
+
+    def _refresh(self):
+        generation, sequence = get_log_position()
+        if (generation, sequence) == (self._generation, self._sequence):
+            return
+        with self._lock:
+            if (generation, sequence) == (self._generation, self._sequence):
+                return
+            if (generation != self._generation
+                    or sequence < self._sequence):
+                self._build(generation, sequence)
+                return
+            keys = [f'{CHANGE_KEY}:{generation}:{number}'
+                    for number in range(self._sequence + 1, sequence + 1)]
+            changes = cache.get_many(keys)
+            recipe_ids = set(changes.values())
+            if (len(changes) < len(keys) or len(self._snapshot.overlay)
+                    + len(recipe_ids) > OVERLAY_LIMIT):
+                self._build(generation, sequence)
+                return
+            self._snapshot = self._snapshot.replace(load_pairs(
+                AmountIngredient.objects.filter(recipe_id__in=recipe_ids)),
+                recipe_ids)
+            self._sequence = sequence
+
+    def search(self, ingredient_ids, min_coverage, limit):
+        """Рецепты, для которых есть не меньше min_coverage ингредиентов.
+
+        Возвращает до limit id рецептов в порядке убывания доли имеющихся
+        ингредиентов, затем их числа, затем id.
+        """
+        self._refresh()
+        snapshot = self._snapshot
+        have = np.unique(np.asarray(list(ingredient_ids), dtype=np.int64))
+        recipe_ids, matched, sizes = snapshot.count(have)
+        coverage = matched / np.maximum(sizes, 1)
+        keep = coverage >= min_coverage
+        recipe_ids, matched, coverage = (
+            recipe_ids[keep], matched[keep], coverage[keep])
+        order = np.lexsort((-recipe_ids, -matched, -coverage))[:limit]
+        return recipe_ids[order].tolist()
+
+
+pantry_index = PantryIndex()
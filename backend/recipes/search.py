@@ -0,0 +1,131 @@
+"""Полнотекстовый поиск рецептов по названию и описанию.
+
+В PostgreSQL используется столбец search_vector типа tsvector с GIN-индексом,
+который заполняется триггером. В SQLite (TEST_DB) - внешняя FTS5-таблица,
+синхронизируемая триггерами с таблицей рецептов. Обе структуры живут вне
+модели и создаются функцией install_search_index.
+"""
+from django.db import connections
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+
+from .models import Recipe
+
+TABLE = Recipe._meta.db_table
+FTS_TABLE = f'{TABLE}_fts'
+SEARCH_CONFIG = 'russian'
+
+POSTGRESQL_VECTOR = (
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce({{row}}.name, '')),"
+    f" 'A') || setweight(to_tsvector('{SEARCH_CONFIG}',"
+    f" coalesce({{row}}.text, '')), 'B')"
+)
+
+POSTGRESQL_INSTALL = (
+    f'ALTER TABLE {TABLE} ADD COLUMN IF NOT EXISTS search_vector tsvector',
+    f'UPDATE {TABLE} SET search_vector = '
+    + POSTGRESQL_VECTOR.format(row=TABLE),
+    f'CREATE INDEX IF NOT EXISTS {TABLE}_search_idx ON {TABLE} '
+    'USING GIN (search_vector)',
+    f'CREATE OR REPLACE FUNCTION {TABLE}_search_update() RETURNS trigger '
+    'AS $$ BEGIN NEW.search_vector := ' + POSTGRESQL_VECTOR.format(row='NEW')
+    + '; RETURN NEW; END $$ LANGUAGE plpgsql',
+    f'DROP TRIGGER IF EXISTS {TABLE}_search_update ON {TABLE}',
+    f'CREATE TRIGGER {TABLE}_search_update BEFORE INSERT OR UPDATE OF '
+    f'name, text ON {TABLE} FOR EACH ROW EXECUTE FUNCTION '
+    f'{TABLE}_search_update()',
+)
+
+POSTGRESQL_UNINSTALL = (
+    f'DROP TRIGGER IF EXISTS {TABLE}_search_update ON {TABLE}',
+    f'DROP FUNCTION IF EXISTS {TABLE}_search_update()',
+    f'ALTER TABLE {TABLE} DROP COLUMN IF EXISTS search_vector',
+)
+
+SQLITE_TRIGGERS = (
+    f'CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {TABLE} '
+    f'BEGIN INSERT INTO {FTS_TABLE}(rowid, name, text) '
+    'VALUES (new.id, new.name, new.text); END',
+    f'CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {TABLE} '
+    f'BEGIN INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, text) '
+    "VALUES ('delete', old.id, old.name, old.text); END",
+    f'CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF name, text '
+    f'ON {TABLE} BEGIN INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, '
+    "text) VALUES ('delete', old.id, old.name, old.text); "
+    f'INSERT INTO {FTS_TABLE}(rowid, name, text) '
+    'VALUES (new.id, new.name, new.text); END',
+)
+
+SQLITE_UNINSTALL = (
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_ai',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_ad',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_au',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+)
+
+
+def install_search_index(connection):
+    """Создает поисковый индекс, если его нет.
+
+    Пересоздание таблицы рецептов в SQLite удаляет ее триггеры, поэтому
+    функция вызывается и после каждой миграции: недостающие триггеры
+    создаются заново, а FTS-таблица перестраивается.
+    """
+    with connection.cursor() as cursor:
+        if TABLE not in connection.introspection.table_names(cursor):
+            return
+        if connection.vendor == 'postgresql':
+            columns = [column.name for column in connection.introspection
+                       .get_table_description(cursor, TABLE)]
+            if 'search_vector' not in columns:
+                for statement in POSTGRESQL_INSTALL:
+                    cursor.execute(statement)
+        elif connection.vendor == 'sqlite':
+            cursor.execute(
+                "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' "
+                'AND name LIKE %s', (f'{FTS_TABLE}_%',))
+            if cursor.fetchone()[0] == len(SQLITE_TRIGGERS):
+                return
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING '
+                f"fts5(name, text, content='{TABLE}', content_rowid='id')")
+            for statement in SQLITE_TRIGGERS:
+                cursor.execute(statement)
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def uninstall_search_index(connection):
+    statements = {
+        'postgresql': POSTGRESQL_UNINSTALL,
+        'sqlite': SQLITE_UNINSTALL,
+    }.get(connection.vendor, ())
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def search_recipes(queryset, query):
+    """Оставляет рецепты, подходящие под запрос, и сортирует их по рангу."""
+    words = query.split()
+    if not words:
+        return queryset
+    if connections[queryset.db].vendor == 'postgresql':
+        tsquery = f"plainto_tsquery('{SEARCH_CONFIG}', %s)"
+        queryset = queryset.filter(RawSQL(
+            f'{TABLE}.search_vector @@ {tsquery}', (query,),
+            output_field=BooleanField()))
+        rank = RawSQL(f'ts_rank({TABLE}.search_vector, {tsquery})',
+                      (query,), output_field=FloatField())
+    else:
+        match = ' '.join('"{}"*'.format(word.replace('"', '""'))
+                         for word in words)
+        queryset = queryset.filter(pk__in=RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+            (match,)))
+        rank = RawSQL(
+            f'SELECT -bm25({FTS_TABLE}, 10.0, 1.0) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid = {TABLE}.id',
+            (match,), output_field=FloatField())
+    return queryset.annotate(search_rank=rank).order_by(
+        '-search_rank', '-pub_date')
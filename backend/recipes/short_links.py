@@ -0,0 +1,158 @@
+"""Короткие ссылки на рецепты.
+
+Код ссылки - base62 от первичного ключа, переставленного умножением на
+взаимно простое с 62 ** CODE_LENGTH число и сдвинутого на соль. Такое
+отображение взаимно однозначно, поэтому коды не повторяются и не требуют
+проверки в базе.
+"""
+import atexit
+import string
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.db.models import Case, F, PositiveIntegerField, Value, When
+
+from .models import Recipe
+
+ALPHABET = string.digits + string.ascii_letters
+CODE_LENGTH = 7
+CODE_SPACE = len(ALPHABET) ** CODE_LENGTH
+MULTIPLIER = 1580030173
+
+
+def encode_short_link(pk):
+    value = (pk * MULTIPLIER + settings.SHORT_LINK_SALT) % CODE_SPACE
+    chars = []
+    for _ in range(CODE_LENGTH):
+        value, remainder = divmod(value, len(ALPHABET))
+        chars.append(ALPHABET[remainder])
+    return ''.join(reversed(chars))
+
+
+class ShortLinkResolver:
+    """LRU-кэш кодов коротких ссылок в памяти процесса.
+
+    Найденные коды хранятся до вытеснения, ненайденные - не дольше
+    negative_ttl секунд.
+    """
+
+    def __init__(self, maxsize, negative_ttl):
+        self.maxsize = maxsize
+        self.negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def resolve(self, short_link):
+        """Возвращает id рецепта по коду ссылки или None."""
+        with self._lock:
+            entry = self._entries.get(short_link)
+            if entry is not None:
+                recipe_id, expires = entry
+                if expires is None or expires > time.monotonic():
+                    self._entries.move_to_end(short_link)
+                    return recipe_id
+                del self._entries[short_link]
+
+        recipe_id = Recipe.objects.filter(
+            short_link=short_link).values_list('id', flat=True).first()
+        expires = (None if recipe_id is not None
+                   else time.monotonic() + self.negative_ttl)
+        with self._lock:
+            self._entries[short_link] = (recipe_id, expires)
+            self._entries.move_to_end(short_link)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return recipe_id
+
+    def discard(self, short_link):
+        with self._lock:
+            self._entries.pop(short_link, None)
+
+
+short_link_resolver = ShortLinkResolver(settings.SHORT_LINK_CACHE_SIZE,
+                                        settings.SHORT_LINK_NEGATIVE_TTL)
+
+
+class ShortLinkClicks:
+    """Буфер счетчиков переходов по коротким ссылкам в памяти процесса.
+
+    Счетчики записываются в базу одним UPDATE в фоновом потоке, когда
+    буфер набирает flush_size рецептов, по таймеру не позже чем через
+    flush_interval секунд после первого незаписанного перехода, а также
+    при завершении процесса.
+    """
+
+    def __init__(self, flush_interval, flush_size):
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self._lock = threading.Lock()
+        self._counts = Counter()
+        self._timer = None
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    def add(self, recipe_id):
+        with self._lock:
+            self._counts[recipe_id] += 1
+            if len(self._counts) < self.flush_size:
+                if self._timer is None:
+                    self._timer = threading.Timer(self.flush_interval,
+                                                  self._flush_in_thread)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+            counts = self._take()
+        self._executor.submit(self._write_in_thread, counts)
+
+    def pending(self, recipe_id):
+        with self._lock:
+            return self._counts[recipe_id]
+
+    def flush(self):
+        with self._lock:
+            counts = self._take()
+        self._write(counts)
+
+    def _take(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        counts, self._counts = self._counts, Counter()
+        return counts
+
+    def _flush_in_thread(self):
+        with self._lock:
+            counts = self._take()
+        self._write_in_thread(counts)
+
+    def _write_in_thread(self, counts):
+        try:
+            self._write(counts)
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _write(counts):
+        if not counts:
+            return
+        Recipe.objects.filter(pk__in=counts).update(
+            short_link_clicks=F('short_link_clicks') + Case(
+                *(When(pk=pk, then=Value(count))
+                  for pk, count in counts.items()),
+                output_field=PositiveIntegerField()))
+
+
+short_link_clicks = ShortLinkClicks(settings.SHORT_LINK_CLICKS_FLUSH_INTERVAL,
+                                    settings.SHORT_LINK_CLICKS_FLUSH_SIZE)
+
+
+@atexit.register
+def flush_short_link_clicks():
+    try:
+        short_link_clicks.flush()
+    except DatabaseError:
+        # База может быть уже недоступна; счетчики - не критичные данные.
+        pass
@@ -0,0 +1,183 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import (m2m_changed, post_delete,
+                                      post_migrate, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from users.models import Subscribe
+
+from .counters import change_counter
+from .files import FILE_FIELDS, acquire, file_names, release
+from .ingredient_search import ingredient_index
+from .models import (Cart, Favorite, Ingredient, Recipe, ShoppingListItem,
+                     Tag, popularity_decay)
+from .pantry_search import log_recipe_change
+from .search import install_search_index
+from .short_links import short_link_resolver
+
+User = get_user_model()
+
+PROFILE_FIELDS = {'email', 'username', 'first_name', 'last_name', 'avatar'}
+RECIPE_MARK_COUNTERS = {
+    Favorite: 'favorites_count',
+    Cart: 'shopping_cart_count',
+}
+RECIPE_MARK_WEIGHTS = {
+    Favorite: 'favorite',
+    Cart: 'cart',
+}
+
+
+def stored_file_fields(sender, update_fields):
+    fields = FILE_FIELDS[sender]
+    if update_fields is not None:
+        fields = tuple(field for field in fields if field in update_fields)
+    return fields
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def touch_recipe_on_tags_change(sender, instance, action, reverse, pk_set,
+                                **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        Recipe.objects.filter(pk=instance.pk).touch()
+    elif pk_set:
+        Recipe.objects.filter(pk__in=pk_set).touch()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def touch_recipes_on_tag_change(sender, instance, **kwargs):
+    Recipe.objects.filter(tags=instance).touch()
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(pre_delete, sender=Ingredient)
+def touch_recipes_on_ingredient_change(sender, instance, **kwargs):
+    Recipe.objects.filter(ingredients__ingredient=instance).touch()
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredient_index(sender, **kwargs):
+    ingredient_index.invalidate()
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def discard_short_link(sender, instance, **kwargs):
+    if instance.short_link:
+        short_link_resolver.discard(instance.short_link)
+
+
+@receiver(post_delete, sender=Recipe)
+def log_deleted_recipe(sender, instance, **kwargs):
+    log_recipe_change(instance.id)
+
+
+@receiver(post_save, sender=Cart)
+def add_recipe_to_shopping_list(sender, instance, created, **kwargs):
+    if created:
+        ShoppingListItem.objects.apply_recipe(
+            instance.recipe_id, 1, [instance.user_id])
+
+
+@receiver(pre_delete, sender=Cart)
+def remove_recipe_from_shopping_list(sender, instance, **kwargs):
+    ShoppingListItem.objects.apply_recipe(
+        instance.recipe_id, -1, [instance.user_id])
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=Cart)
+def count_added_recipe_mark(sender, instance, created, **kwargs):
+    if created:
+        weight = settings.POPULARITY_WEIGHTS[RECIPE_MARK_WEIGHTS[sender]]
+        change_counter(Recipe, instance.recipe_id,
+                       RECIPE_MARK_COUNTERS[sender], 1,
+                       popularity=F('popularity') + weight)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=Cart)
+def count_removed_recipe_mark(sender, instance, **kwargs):
+    # Вклад отметки уже уменьшен decay_popularity, вычитается его остаток.
+    hours = (timezone.now() - instance.added_at).total_seconds() / 3600
+    weight = (settings.POPULARITY_WEIGHTS[RECIPE_MARK_WEIGHTS[sender]]
+              * popularity_decay(hours))
+    change_counter(Recipe, instance.recipe_id,
+                   RECIPE_MARK_COUNTERS[sender], -1,
+                   popularity=Greatest(F('popularity') - weight, 0.0))
+
+
+@receiver(post_save, sender=Recipe)
+def count_added_recipe(sender, instance, created, **kwargs):
+    if created and instance.author_id:
+        change_counter(User, instance.author_id, 'recipes_count', 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def count_removed_recipe(sender, instance, **kwargs):
+    if instance.author_id:
+        change_counter(User, instance.author_id, 'recipes_count', -1)
+
+
+@receiver(post_save, sender=Subscribe)
+def count_added_follower(sender, instance, created, **kwargs):
+    if created:
+        change_counter(User, instance.author_id, 'followers_count', 1)
+
+
+@receiver(post_delete, sender=Subscribe)
+def count_removed_follower(sender, instance, **kwargs):
+    change_counter(User, instance.author_id, 'followers_count', -1)
+
+
+@receiver(pre_save, sender=Recipe)
+@receiver(pre_save, sender=User)
+def remember_stored_files(sender, instance, update_fields, **kwargs):
+    fields = stored_file_fields(sender, update_fields)
+    instance._stored_files = set()
+    if fields and not instance._state.adding:
+        old = sender.objects.filter(pk=instance.pk).only(*fields).first()
+        if old is not None:
+            instance._stored_files = file_names(old, fields)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=User)
+def count_stored_file_references(sender, instance, update_fields, **kwargs):
+    fields = stored_file_fields(sender, update_fields)
+    if not fields:
+        return
+    old, new = instance._stored_files, file_names(instance, fields)
+    acquire(new - old)
+    release(old - new)
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=User)
+def release_stored_files(sender, instance, **kwargs):
+    release(file_names(instance, FILE_FIELDS[sender]))
+
+
+@receiver(post_save, sender=User)
+def touch_recipes_on_profile_change(sender, instance, created,
+                                    update_fields, **kwargs):
+    if created:
+        return
+    if update_fields is not None and not PROFILE_FIELDS & set(update_fields):
+        return
+    Recipe.objects.filter(author=instance).touch()
+
+
+@receiver(post_migrate)
+def restore_search_index(sender, using, **kwargs):
+    if sender.name == 'recipes':
+        install_search_index(connections[using])
@@ -0,0 +1,110 @@
+"""Похожие рецепты по общим ингредиентам.
+
+Рецепты - строки разреженной матрицы рецепт × ингредиент с весами IDF:
+редкие ингредиенты весят больше, а самые частые (соль, вода) не
+учитываются вовсе. Строки нормированы, поэтому произведение пачки строк
+на транспонированную матрицу дает косинусное сходство со всеми рецептами
+сразу; для каждого рецепта сохраняются limit самых похожих.
+"""
+from itertools import chain
+
+import numpy as np
+from django.db import transaction
+from scipy import sparse
+
+from .models import AmountIngredient, Recipe, SimilarRecipe
+
+BATCH_SIZE = 1000
+FETCH_SIZE = 10000
+COMMON_INGREDIENT_SHARE = 0.01
+COMMON_INGREDIENT_MIN_RECIPES = 100
+
+
+class RecipeMatrix:
+    def __init__(self):
+        pairs = np.fromiter(
+            chain.from_iterable(
+                AmountIngredient.objects.order_by()
+                .values_list('recipe_id', 'ingredient_id')
+                .iterator(chunk_size=FETCH_SIZE)),
+            dtype=np.int64).reshape(-1, 2)
+        self.recipe_ids, rows = np.unique(pairs[:, 0], return_inverse=True)
+        ingredient_ids, columns = np.unique(pairs[:, 1],
+                                            return_inverse=True)
+        recipes_count = len(self.recipe_ids)
+
+        frequency = np.bincount(columns, minlength=len(ingredient_ids))
+        idf = np.log(recipes_count / frequency).astype(np.float32)
+        idf[frequency > max(COMMON_INGREDIENT_SHARE * recipes_count,
+                            COMMON_INGREDIENT_MIN_RECIPES)] = 0
+
+        matrix = sparse.csr_matrix(
+            (idf[columns], (rows, columns)),
+            shape=(recipes_count, len(ingredient_ids)), dtype=np.float32)
+        matrix.eliminate_zeros()
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)))
+        norms[norms == 0] = 1
+        self.matrix = sparse.csr_matrix(matrix.multiply(1 / norms))
+        self.transposed = self.matrix.T.tocsr()
+
+    def rows(self, recipe_ids):
+        recipe_ids = np.fromiter(recipe_ids, dtype=np.int64)
+        rows = np.searchsorted(self.recipe_ids, recipe_ids)
+        found = rows < len(self.recipe_ids)
+        found[found] = self.recipe_ids[rows[found]] == recipe_ids[found]
+        return np.unique(rows[found])
+
+    def neighbours(self, rows, limit):
+        """Для каждой строки - id рецепта, id похожих и их сходство."""
+        product = (self.matrix[rows] @ self.transposed).tocsr()
+        for index, row in enumerate(rows):
+            start, end = product.indptr[index], product.indptr[index + 1]
+            columns = product.indices[start:end]
+            scores = product.data[start:end]
+            keep = columns != row
+            columns, scores = columns[keep], scores[keep]
+            if len(scores) > limit:
+                top = np.argpartition(-scores, limit)[:limit]
+                columns, scores = columns[top], scores[top]
+            yield self.recipe_ids[row], self.recipe_ids[columns], scores
+
+
+def update_similar_recipes(limit, only_new=False, batch_size=BATCH_SIZE):
+    """Пересчитывает похожие рецепты, возвращает число рецептов.
+
+    С only_new считаются только рецепты без сохраненных похожих и их
+    соседи, в списки которых могли попасть новые рецепты.
+    """
+    matrix = RecipeMatrix()
+    if only_new:
+        new_rows = matrix.rows(Recipe.objects.filter(
+            similar_recipes__isnull=True).values_list('id', flat=True))
+        neighbour_ids = set()
+        for start in range(0, len(new_rows), batch_size):
+            for _, similar_ids, _ in write_batch(
+                    matrix, new_rows[start:start + batch_size], limit):
+                neighbour_ids.update(similar_ids.tolist())
+        rows = matrix.rows(neighbour_ids.difference(
+            matrix.recipe_ids[new_rows].tolist()))
+        updated = len(new_rows)
+    else:
+        rows = np.arange(len(matrix.recipe_ids))
+        updated = 0
+    for start in range(0, len(rows), batch_size):
+        write_batch(matrix, rows[start:start + batch_size], limit)
+    return updated + len(rows)
+
+
+def write_batch(matrix, rows, limit):
+    neighbours = list(matrix.neighbours(rows, limit))
+    with transaction.atomic():
+        SimilarRecipe.objects.filter(
+            recipe_id__in=matrix.recipe_ids[rows].tolist()).delete()
+        SimilarRecipe.objects.bulk_create(
+            (SimilarRecipe(recipe_id=int(recipe_id), similar_id=similar_id,
+                           score=score)
+             for recipe_id, similar_ids, scores in neighbours
+             for similar_id, score in zip(similar_ids.tolist(),
+                                          scores.tolist())),
+            batch_size=FETCH_SIZE)
+    return neighbours
@@ -0,0 +1,64 @@
+"""Хранилище файлов с именами по содержимому.
+
+Файл сохраняется под SHA-256 своего содержимого в каталоге upload_to,
+поэтому одинаковые загрузки хранятся один раз, а содержимое файла с
+данным именем никогда не меняется и может кэшироваться навсегда. Имена,
+уже построенные по содержимому (аватары, миниатюры), не пересчитываются.
+"""
+import hashlib
+import os
+import re
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+
+DIGEST_LENGTH = 32
+HASHED_STEM = re.compile(rf'^[0-9a-f]{{{DIGEST_LENGTH}}}(_\w+)?$')
+
+
+def is_content_addressed(name):
+    stem = os.path.splitext(os.path.basename(name))[0]
+    return bool(HASHED_STEM.match(stem))
+
+
+def content_name(name, content):
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    directory, basename = os.path.split(name)
+    extension = os.path.splitext(basename)[1].lower()
+    return os.path.join(directory,
+                        digest.hexdigest()[:DIGEST_LENGTH] + extension)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def claim(self, name):
+        """Блокирует учет существующего файла до конца транзакции.
+
+        Удаление файла без ссылок идет под той же блокировкой, поэтому
+        после нее файл либо остается до фиксации ссылки, либо уже удален,
+        и его нужно записать заново.
+        """
+        from .models import StoredFile
+
+        with transaction.atomic():
+            StoredFile.objects.select_for_update().filter(name=name).exists()
+        return self.exists(name)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        if not is_content_addressed(name):
+            name = content_name(name, content)
+        if self.exists(name) and self.claim(name):
+            return name
+        saved = super().save(name, content, max_length)
+        if saved != name:
+            # Тот же файл параллельно записал другой процесс.
+            self.delete(saved)
+        return name
@@ -25,6 +25,16 @@ class User(AbstractUser):
         null=True,
         blank=True
     )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Рецептов',
+        default=0,
+        editable=False,
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Подписчиков',
+        default=0,
+        editable=False,
+    )
 
     class Meta:
         ordering = ['id']